@@ -0,0 +1,215 @@
+import argparse
+import contextlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from rdflib import Graph
+from rdflib.namespace import DCAT, RDF
+
+from catalog_generator import write_catalog
+from config import FILE_FORMAT, ORGANIZATION_ID
+from dcat_properties_importer import GraphIndex, build_dataset_payload, extract_dataset, iter_dataset_graphs
+from harvester import HarvesterBL
+from utils import payload_fingerprint
+
+# Offline benchmark of the DCAT extraction: parse, extraction, pruning (Payload.to_dict) and payload serialization,
+# timed separately, then parse_rdf_file end to end (parse to prune) in its own run
+
+STAGES = ["parse", "fix_literals", "index", "extract", "prune", "serialize"]
+END_TO_END_STAGES = ["parse", "fix_literals", "index", "extract", "prune"]
+
+OFFLINE_API_PARAMS = {
+    "client_key": "benchmark",
+    "client_secret": "benchmark",
+    "api_get_token_url": "http://localhost/token",
+    "api_base_url": "http://localhost/api",
+    "organization_id": ORGANIZATION_ID,
+    "identifier_pattern": re.compile(r"^CH_KT_BL_dataset_(\d+)$"),
+}
+
+
+class StageTimer:
+    """Collects the duration (and optionally the peak memory) of each stage"""
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.results = {}
+
+    def run(self, stage: str, function: Callable, *args):
+        if self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = function(*args)
+        duration = time.perf_counter() - start
+        self.results[stage] = {"seconds": round(duration, 4)}
+        if self.memory:
+            self.results[stage]["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        return result
+
+
+def run_stages(harvester: HarvesterBL, catalog_path: str, timer: StageTimer) -> int:
+    """
+    Runs the steps of HarvesterBL.parse_rdf_file one by one, then serializes the payloads.
+    The payload objects are built first (extract), then pruned of their empty fields (prune)
+    """
+    graph = Graph()
+    timer.run("parse", graph.parse, catalog_path, None, FILE_FORMAT)
+    timer.run("fix_literals", harvester.fix_bad_resource_literals, graph)
+    index = timer.run("index", GraphIndex, graph)
+    dataset_uris = list(graph.subjects(RDF.type, DCAT.Dataset))
+    payloads = timer.run("extract", lambda: [build_dataset_payload(index, uri) for uri in dataset_uris])
+    payloads = [payload for payload in payloads if payload is not None]
+    datasets = timer.run("prune", lambda: [payload.to_dict() for payload in payloads])
+    timer.run(
+        "serialize",
+        lambda: [
+            (json.dumps(harvester.create_dataset_payload(dataset)), payload_fingerprint(dataset)) for dataset in datasets
+        ],
+    )
+    return len(datasets)
+
+
+def benchmark(catalog_path: str, memory: bool = False) -> Dict:
+    harvester = HarvesterBL(OFFLINE_API_PARAMS)
+    timer = StageTimer(memory)
+    end_to_end_timer = StageTimer(memory)
+    if memory:
+        tracemalloc.start()
+    try:
+        # The extraction prints a line per dataset
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            valid = run_stages(harvester, catalog_path, timer)
+            end_to_end_timer.run("end_to_end", harvester.parse_rdf_file, catalog_path)
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return {
+        "catalog": catalog_path,
+        "valid_datasets": valid,
+        "stages": timer.results,
+        # Separate run of the steps timed as END_TO_END_STAGES, not to be added to the stages
+        "end_to_end": end_to_end_timer.results["end_to_end"],
+    }
+
+
+def extract_fingerprints(catalog_path: str, stream: bool) -> Dict[str, str]:
+    """identifier -> payload fingerprint of the datasets extracted in graph mode, or in streaming mode"""
+    datasets = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if stream:
+            with open(catalog_path, "rb") as export:
+                for dataset_uri, graph in iter_dataset_graphs(export):
+                    datasets.append(extract_dataset(GraphIndex(graph), dataset_uri))
+        else:
+            # Parsed from the bytes like HarvesterBL.fetch_datasets_from_api (no file base for relative URIs)
+            with open(catalog_path, "rb") as export:
+                graph = Graph()
+                graph.parse(data=export.read(), format="xml")
+            index = GraphIndex(graph)
+            datasets = [extract_dataset(index, uri) for uri in graph.subjects(RDF.type, DCAT.Dataset)]
+    return {dataset["identifiers"][0]: payload_fingerprint(dataset) for dataset in datasets if dataset}
+
+
+def check_stream_equivalence(catalog_path: str) -> int:
+    """
+    Compares the payloads of the streaming extraction (STREAM_DCAT_EXPORT) with the graph extraction.
+    Each mode runs in its own process, so that no cache filled by one mode (e.g. theme codes) hides a difference
+    """
+    fingerprints = {}
+    for mode in ("graph", "stream"):
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--extract", mode, catalog_path],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+        fingerprints[mode] = json.loads(process.stdout)
+
+    identifiers = sorted(set(fingerprints["graph"]) | set(fingerprints["stream"]))
+    different = [
+        identifier for identifier in identifiers if fingerprints["graph"].get(identifier) != fingerprints["stream"].get(identifier)
+    ]
+    for identifier in different:
+        print(f"Different payloads for {identifier}")
+    print(
+        f"Stream equivalence ({os.path.basename(catalog_path)}): "
+        f"{len(identifiers) - len(different)}/{len(identifiers)} payloads identical to the graph extraction"
+    )
+    return len(different)
+
+
+def print_results(results: List[Dict]):
+    """Stage table, with parse_rdf_file end to end next to the sum of the stages it runs"""
+    print(
+        f"{'catalog':<40}{'datasets':>10}"
+        + "".join(f"{stage:>14}" for stage in STAGES)
+        + f"{'parse..prune':>14}{'end_to_end':>14}"
+    )
+    for result in results:
+        stages = result["stages"]
+        covered = sum(stages[stage]["seconds"] for stage in END_TO_END_STAGES)
+        print(
+            f"{os.path.basename(result['catalog']):<40}{result['valid_datasets']:>10}"
+            + "".join(f"{stages[stage]['seconds']:>13.2f}s" for stage in STAGES)
+            + f"{covered:>13.2f}s{result['end_to_end']['seconds']:>13.2f}s"
+        )
+        if all("peak_mb" in stages[stage] for stage in STAGES):
+            print(
+                f"{'  peak MB':<50}"
+                + "".join(f"{stages[stage]['peak_mb']:>14.1f}" for stage in STAGES)
+                + f"{'':>14}{result['end_to_end']['peak_mb']:>14.1f}"
+            )
+
+
+def main(argv: List[str] = None):
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the DCAT extraction on synthetic or existing catalogs")
+    arg_parser.add_argument("--datasets", type=int, nargs="*", default=[1000, 10000], help="sizes of the generated catalogs")
+    arg_parser.add_argument("--catalog", nargs="*", default=[], help="existing RDF/XML catalogs to benchmark as well")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--memory", action="store_true", help="record the peak memory of each stage (slower)")
+    arg_parser.add_argument("--json", help="write the results to this file")
+    arg_parser.add_argument(
+        "--check-stream", action="store_true", help="only compare the streaming extraction with the graph extraction"
+    )
+    arg_parser.add_argument("--extract", nargs=2, metavar=("MODE", "CATALOG"), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args(argv)
+
+    if args.extract:
+        mode, catalog_path = args.extract
+        print(json.dumps(extract_fingerprints(catalog_path, stream=mode == "stream")))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        catalogs = list(args.catalog)
+        for size in args.datasets:
+            path = os.path.join(directory, f"catalog_{size}.xml")
+            with open(path, "w", encoding="utf-8") as output:
+                write_catalog(output, size, seed=args.seed)
+            catalogs.append(path)
+
+        if args.check_stream:
+            differences = sum(check_stream_equivalence(catalog_path) for catalog_path in catalogs)
+            if differences:
+                raise SystemExit(1)
+            return
+
+        for catalog_path in catalogs:
+            print(f"Benchmarking {catalog_path}")
+            results.append(benchmark(catalog_path, args.memory))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
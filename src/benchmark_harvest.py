@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from i14y_stub_server import add_stub_arguments, create_server
+
+# End-to-end throughput of harvest() and of the structure import against the local stand-in (i14y_stub_server.py),
+# for several numbers of worker threads. Each run is a separate process, as the settings are read from the environment
+
+
+def run_child() -> Dict:
+    """Runs one harvest and structure import against the servers of the environment and returns the timings"""
+    from config import ORGANIZATION_ID, PIPELINE_STRUCTURE_IMPORT
+    from harvester import HarvesterBL
+    from structure_importer import StructureImporter
+    from common import RETRY_POLICY, write_concurrency_report
+
+    api_params = {
+        "client_key": os.environ["CLIENT_KEY"],
+        "client_secret": os.environ["CLIENT_SECRET"],
+        "api_get_token_url": os.environ["GET_TOKEN_URL"],
+        "api_base_url": os.environ["API_BASE_URL"],
+        "organization_id": ORGANIZATION_ID,
+        "identifier_pattern": re.compile(r"^CH_KT_BL_dataset_(\d+)$"),
+    }
+
+    harvester = HarvesterBL(api_params)
+    importer = StructureImporter(api_params)
+    import_error = None
+
+    start = time.perf_counter()
+    if PIPELINE_STRUCTURE_IMPORT:
+        # The structures are imported during the harvest: import_seconds is the wait for the queue to drain
+        importer.start_pipeline()
+        harvester.harvest(on_dataset_written=importer.submit_structure)
+        harvest_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            importer.finish_pipeline(snapshot=harvester.catalog_snapshot)
+        except Exception as e:
+            import_error = str(e)
+    else:
+        harvester.harvest()
+        harvest_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            importer.run_import(importer.create_datasets_to_process(), snapshot=harvester.catalog_snapshot)
+        except Exception as e:
+            import_error = str(e)
+    import_seconds = time.perf_counter() - start
+    statuses = harvester.load_data(harvester.datasets_file_path)
+
+    return {
+        "harvest_seconds": round(harvest_seconds, 2),
+        "import_seconds": round(import_seconds, 2),
+        "counts": {status: len(identifiers) for status, identifiers in statuses.items()},
+        "structures": len(statuses.get("created", {})) + len(statuses.get("updated", {})),
+        "import_error": import_error,
+        "write_concurrency": write_concurrency_report(),
+        "retries": RETRY_POLICY.report(),
+    }
+
+
+def run_benchmark(args: argparse.Namespace, workers: int) -> Dict:
+    """Starts a fresh stand-in and runs the harvest with the given number of workers in a child process"""
+    server = create_server(args)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, **server.environment())
+            env["MAX_WORKERS"] = str(workers)
+            env["WRITE_CONCURRENCY_MAX"] = str(workers)
+            env["PIPELINE_STRUCTURE_IMPORT"] = "true" if args.pipeline else "false"
+            log_path = os.path.join(directory, "benchmark_output.txt")
+            with open(log_path, "w") as log:
+                process = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child"],
+                    cwd=directory,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=log,
+                    text=True,
+                )
+            if process.returncode != 0:
+                with open(log_path) as log:
+                    raise RuntimeError(f"Harvest run failed ({process.returncode}):\n{log.read()[-2000:]}")
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    processed = sum(result["counts"].values())
+    result["workers"] = workers
+    result["harvest_datasets_per_second"] = round(processed / result["harvest_seconds"], 2)
+    result["import_datasets_per_second"] = (
+        round(result["structures"] / result["import_seconds"], 2) if result["import_seconds"] else None
+    )
+    result["server"] = server.statistics.to_dict()
+    return result
+
+
+def check_resume_not_modified(args: argparse.Namespace) -> bool:
+    """
+    Runs the harvester with the structure import, then again with --resume on the unmodified export (304), with only
+    OGD_BL/state kept like the CI cache: the harvest is skipped and the structure import must still succeed
+    """
+    harvester_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "harvester.py")
+    server = create_server(args)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, **server.environment())
+            env["IMPORT_STRUCTURES"] = "true"
+            env["PIPELINE_STRUCTURE_IMPORT"] = "false"
+            for harvester_args in ([], ["--resume"]):
+                process = subprocess.run(
+                    [sys.executable, harvester_path, *harvester_args],
+                    cwd=directory,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                )
+                if process.returncode != 0:
+                    print(f"harvester.py {' '.join(harvester_args)} failed ({process.returncode}):")
+                    print(process.stdout[-2000:])
+                    return False
+                shutil.rmtree(os.path.join(directory, "OGD_BL", "data"), ignore_errors=True)
+
+            if "Harvest skipped" not in process.stdout:
+                print("The --resume run was not skipped: the export was not served as not modified")
+                return False
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print("Resume on an unmodified export: harvest skipped, structure import completed")
+    return True
+
+
+def print_results(results: List[Dict]):
+    print(
+        f"{'workers':>8}{'harvest s':>11}{'datasets/s':>12}{'import s':>10}{'structures/s':>14}"
+        f"{'lock fails':>12}{'max writes':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['workers']:>8}{result['harvest_seconds']:>11.2f}{result['harvest_datasets_per_second']:>12.2f}"
+            f"{result['import_seconds']:>10.2f}{result['import_datasets_per_second'] or 0:>14.2f}"
+            f"{result['server']['lock_failures']:>12}{result['server']['max_writes_in_flight']:>12}"
+        )
+        print(f"{'':>8}{result['write_concurrency']}; {result['retries']}")
+        if result["import_error"]:
+            print(f"{'':>8}Structure import: {result['import_error']}")
+
+
+def main(argv: List[str] = None):
+    arg_parser = argparse.ArgumentParser(description="Benchmarks harvest() and the structure import against a stand-in")
+    add_stub_arguments(arg_parser)
+    arg_parser.add_argument("--workers", type=int, nargs="*", default=[1, 4, 8], help="values of MAX_WORKERS to compare")
+    arg_parser.add_argument(
+        "--pipeline", action="store_true", help="import the structures during the harvest (PIPELINE_STRUCTURE_IMPORT)"
+    )
+    arg_parser.add_argument("--json", help="write the results to this file")
+    arg_parser.add_argument(
+        "--check-resume",
+        action="store_true",
+        help="only check that --resume on an unmodified export (304) still runs the structure import",
+    )
+    arg_parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args(argv)
+
+    if args.check_resume:
+        if not check_resume_not_modified(args):
+            raise SystemExit(1)
+        return
+
+    if args.child:
+        # The harvest prints a lot: keep stdout for the result
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        result = run_child()
+        sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    results = []
+    for workers in args.workers:
+        print(f"Harvesting {args.datasets} datasets with {workers} workers...")
+        results.append(run_benchmark(args, workers))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import random
+import time
+from typing import Dict, List
+
+from rdflib import DCTERMS, RDF, RDFS, SH, XSD, Graph, Literal, Namespace, URIRef
+from rdflib.compare import isomorphic
+
+from shacl_writer import write_shacl_turtle
+
+# Checks that shacl_writer writes the same SHACL structures as the rdflib graph it replaced, and times both
+
+TIMESTAMP = "2026-01-01T00:00:00"
+
+DATATYPES = ["string", "integer", "decimal", "gYear", "date", "boolean", "dateTime", "anyURI", "unknown"]
+
+TEXTS = [
+    "Anzahl Personen",
+    'Wert "in" Franken',
+    "Zeile 1\nZeile 2\r\nZeile 3",
+    "Tab\tgetrennt",
+    "C:\\Pfad\\zur Datei",
+    "Ümlaute, accents é è, ß and emoji 🚲",
+    "",
+    "ends with a quote\"",
+    '"""triple quoted"""',
+]
+
+PATTERNS = [
+    r"^\s*\[\s*-?\d+(\.\d+)?\s*,\s*-?\d+(\.\d+)?\s*\]\s*$",
+    r'^\s*\{\s*"coordinates"\s*:\s*\[.*\]\s*,\s*"type"\s*:\s*"(Polygon|Point)"\s*\}\s*$',
+    None,
+]
+
+
+def build_shacl_graph(metadata: Dict, timestamp: str = TIMESTAMP) -> Graph:
+    """rdflib version of the SHACL structure (StructureImporter.create_shacl_graph before shacl_writer)"""
+    g = Graph()
+    I14Y_NS = Namespace("https://www.i14y.admin.ch/resources/datasets/structure/")
+    g.bind("sh", SH)
+    g.bind("dcterms", DCTERMS)
+    g.bind("rdfs", RDFS)
+    g.bind("xsd", XSD)
+    g.bind("i14y", I14Y_NS)
+
+    shape_name = f"{metadata['identifier']}Shape"
+    shape_uri = I14Y_NS[shape_name]
+    g.add((shape_uri, RDF.type, SH.NodeShape))
+    for lang, title in metadata["title"].items():
+        g.add((shape_uri, RDFS.label, Literal(title, lang=lang)))
+    for lang, desc in metadata["description"].items():
+        g.add((shape_uri, DCTERMS.description, Literal(desc, lang=lang)))
+    g.add((shape_uri, DCTERMS.created, Literal(timestamp, datatype=XSD.dateTime)))
+    g.add((shape_uri, DCTERMS.modified, Literal(timestamp, datatype=XSD.dateTime)))
+    g.add((shape_uri, SH.closed, Literal(True)))
+
+    datatype_map = {
+        "string": XSD.string,
+        "integer": XSD.integer,
+        "decimal": XSD.decimal,
+        "gYear": XSD.gYear,
+        "date": XSD.date,
+        "boolean": XSD.boolean,
+        "dateTime": XSD.dateTime,
+        "anyURI": XSD.anyURI,
+    }
+    for i, prop in enumerate(metadata["properties"]):
+        prop_uri = I14Y_NS[f"{shape_name}/{prop['name']}"]
+        g.add((prop_uri, RDF.type, SH.PropertyShape))
+        g.add((shape_uri, SH.property, prop_uri))
+        g.add((prop_uri, SH.path, prop_uri))
+        g.add((prop_uri, SH.order, Literal(i)))
+        g.add((prop_uri, SH.minCount, Literal(1)))
+        g.add((prop_uri, SH.maxCount, Literal(1)))
+        g.add((prop_uri, SH.datatype, datatype_map.get(prop["datatype"], XSD.string)))
+        for lang, label in prop["labels"].items():
+            g.add((prop_uri, SH.name, Literal(label, lang=lang)))
+        if prop.get("pattern"):
+            g.add((prop_uri, SH.pattern, Literal(prop["pattern"])))
+        if prop.get("conformsTo"):
+            g.add((prop_uri, DCTERMS.conformsTo, URIRef(prop["conformsTo"])))
+        if prop.get("description"):
+            for lang, desc in prop["description"].items():
+                if desc:
+                    g.add((prop_uri, SH.description, Literal(desc, lang=lang)))
+    return g
+
+
+def random_metadata(rng: random.Random, fields: int) -> Dict:
+    """Metadata shaped like StructureImporter.get_bl_metadata, with texts that need escaping"""
+    lang = rng.choice(["de", "fr", "en"])
+    properties = []
+    for position in range(fields):
+        prop = {
+            "name": rng.choice(["feld", "wert", "jahr_2024", "geo_shape"]) + f"_{position}",
+            "datatype": rng.choice(DATATYPES),
+            "labels": {lang: rng.choice(TEXTS)},
+        }
+        pattern = rng.choice(PATTERNS)
+        if pattern:
+            prop["pattern"] = pattern
+        if rng.random() < 0.3:
+            prop["conformsTo"] = f"https://www.geo.bl.ch/modelle/{position}?version=2&lang={lang}"
+        if rng.random() < 0.3:
+            prop["description"] = {"en": rng.choice(TEXTS)}
+        properties.append(prop)
+    return {
+        "identifier": f"CH_KT_BL_dataset_{rng.randint(10000, 20000)}",
+        "title": {lang: rng.choice(TEXTS)},
+        "description": {lang: rng.choice(TEXTS)},
+        "properties": properties,
+    }
+
+
+def check_equivalence(samples: int, seed: int) -> int:
+    """Parses the Turtle of the writer and compares it with the rdflib graph, returns the number of differences"""
+    rng = random.Random(seed)
+    differences = 0
+    for _ in range(samples):
+        metadata = random_metadata(rng, rng.randint(0, 40))
+        written = Graph().parse(data=write_shacl_turtle(metadata, timestamp=TIMESTAMP), format="turtle")
+        if not isomorphic(written, build_shacl_graph(metadata)):
+            differences += 1
+            print(f"Different structures for {metadata['identifier']}")
+    return differences
+
+
+def time_call(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv: List[str] = None):
+    arg_parser = argparse.ArgumentParser(description="Compares shacl_writer with the rdflib SHACL graph")
+    arg_parser.add_argument("--samples", type=int, default=500, help="random structures checked for equivalence")
+    arg_parser.add_argument("--fields", type=int, nargs="*", default=[10, 100, 500], help="field counts to time")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args(argv)
+
+    differences = check_equivalence(args.samples, args.seed)
+    print(f"Equivalence: {args.samples - differences}/{args.samples} structures identical to the rdflib graph")
+
+    rng = random.Random(args.seed)
+    print(f"{'fields':>8}{'rdflib ms':>12}{'writer ms':>12}{'speedup':>10}")
+    for fields in args.fields:
+        metadata = random_metadata(rng, fields)
+        rdflib_seconds = time_call(lambda: build_shacl_graph(metadata).serialize(format="turtle"), args.repeat)
+        writer_seconds = time_call(lambda: write_shacl_turtle(metadata, timestamp=TIMESTAMP), args.repeat)
+        print(
+            f"{fields:>8}{rdflib_seconds * 1000:>12.2f}{writer_seconds * 1000:>12.3f}"
+            f"{rdflib_seconds / writer_seconds:>9.0f}x"
+        )
+
+    if differences:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import argparse
+import random
+from typing import List, TextIO
+from xml.sax.saxutils import escape, quoteattr
+
+from mappings import THEME_MAPPING
+
+# Synthetic DCAT-AP catalog in the shape of the data.bl.ch export (RDF/XML), used by the benchmarks
+
+NAMESPACES = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "dcat": "http://www.w3.org/ns/dcat#",
+    "dct": "http://purl.org/dc/terms/",
+    "foaf": "http://xmlns.com/foaf/0.1/",
+    "vcard": "http://www.w3.org/2006/vcard/ns#",
+    "skos": "http://www.w3.org/2004/02/skos/core#",
+    "schema": "http://schema.org/",
+    "spdx": "http://spdx.org/rdf/terms#",
+}
+
+WORDS = (
+    "Daten Kanton Basel-Landschaft Gemeinde Bevölkerung Statistik Jahr Anzahl Bezirk Liestal Arlesheim Umwelt "
+    "Verkehr Messung Station Luftqualität Energieverbrauch Steuern Wahlen Abstimmung Schule Gesundheit Spital "
+    "Wald Wasser Gewässer Temperatur Niederschlag Bauzone Parzelle Strasse Velo öffentlicher Haushalt Einkommen"
+).split()
+
+MEDIA_TYPES = [
+    "text/csv",
+    "application/json",
+    "application/geo+json",
+    "application/vnd.shp",
+    "application/zip",
+    "application/pdf",
+    "text/html",
+]
+
+FREQUENCIES = ["annual", "monthly", "daily", "weekly", "quarterly", "irregular", "continuous"]
+
+LANGUAGES = [
+    "http://publications.europa.eu/resource/authority/language/DEU",
+    "http://publications.europa.eu/resource/authority/language/FRA",
+    "http://id.loc.gov/vocabulary/iso639-1/en",
+    "de",
+]
+
+THEME_LABELS = sorted(set(THEME_MAPPING.values()))
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def html_description(rng: random.Random, number: int) -> str:
+    """Description with the markup found in data.bl.ch descriptions: paragraphs, lists, links, breaks and entities"""
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.random()
+        if kind < 0.45:
+            parts.append(f"<p>{words(rng, rng.randint(8, 40))}.</p>")
+        elif kind < 0.65:
+            items = "".join(f"<li>{words(rng, rng.randint(2, 8))}</li>" for _ in range(rng.randint(2, 6)))
+            parts.append(f"<ul>{items}</ul>")
+        elif kind < 0.8:
+            parts.append(
+                f'<p>Weitere Informationen: <a href="https://www.baselland.ch/themen/{number}?seite={rng.randint(1, 9)}&amp;lang=de" '
+                f'target="_blank">{words(rng, 3)}</a></p>'
+            )
+        elif kind < 0.9:
+            parts.append(f"<p><strong>{words(rng, 2)}</strong><br/>{words(rng, 12)}&nbsp;({rng.randint(1990, 2025)})</p>")
+        else:
+            parts.append(f"{words(rng, 10)} &amp; {words(rng, 6)}<br>")
+    return "".join(parts)
+
+
+def distribution_xml(rng: random.Random, number: int, index: int) -> str:
+    media_type = rng.choice(MEDIA_TYPES)
+    media_type_uri = f"https://www.iana.org/assignments/media-types/{media_type}"
+    base = f"https://data.bl.ch/api/explore/v2.1/catalog/datasets/{number}/exports/{index}"
+    lines = [f'<dcat:distribution><dcat:Distribution rdf:about="{base}">']
+    if index:
+        lines.append(f'<dct:title xml:lang="de">{escape(words(rng, 2))} {index}</dct:title>')
+    if rng.random() < 0.3:
+        lines.append(f'<dct:description xml:lang="de">{escape(words(rng, 10))}</dct:description>')
+    lines.append(f'<dcat:accessURL rdf:resource="{base}/"/>')
+    lines.append(f'<dcat:downloadURL rdf:resource="{base}.dl"/>')
+    lines.append(f'<dcat:mediaType rdf:resource="{media_type_uri}"/>')
+    lines.append(f'<dct:format rdf:resource="{media_type_uri}"/>')
+    lines.append('<dct:license rdf:resource="terms_by"/>')
+    lines.append(f"<dct:issued>{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}</dct:issued>")
+    lines.append(
+        f'<dct:modified rdf:datatype="http://www.w3.org/2001/XMLSchema#dateTime">'
+        f"2026-{rng.randint(1, 10):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00+00:00</dct:modified>"
+    )
+    lines.append(f"<dcat:byteSize>{rng.randint(1000, 50_000_000)}</dcat:byteSize>")
+    lines.append('<dct:language rdf:resource="http://id.loc.gov/vocabulary/iso639-1/de"/>')
+    lines.append("</dcat:Distribution></dcat:distribution>")
+    return "".join(lines)
+
+
+def dataset_xml(rng: random.Random, number: int) -> str:
+    uri = f"https://data.bl.ch/explore/dataset/{number}/"
+    lines = [f'<dcat:dataset><dcat:Dataset rdf:about="{uri}">', f"<dct:identifier>{uri}</dct:identifier>"]
+    lines.append(f'<dct:title xml:lang="de">{escape(words(rng, rng.randint(2, 7)))}</dct:title>')
+    if rng.random() < 0.2:
+        lines.append(f'<dct:title xml:lang="fr">{escape(words(rng, 4))}</dct:title>')
+    if rng.random() < 0.97:
+        lines.append(f'<dct:description xml:lang="de">{escape(html_description(rng, number))}</dct:description>')
+    lines.append(
+        f'<dct:issued rdf:datatype="http://www.w3.org/2001/XMLSchema#dateTime">'
+        f"{rng.randint(2015, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00+00:00</dct:issued>"
+    )
+    lines.append(
+        f'<dct:modified rdf:datatype="http://www.w3.org/2001/XMLSchema#dateTime">'
+        f"2026-{rng.randint(1, 10):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z</dct:modified>"
+    )
+    for _ in range(rng.randint(0, 6)):
+        lines.append(f'<dcat:keyword xml:lang="de">{escape(rng.choice(WORDS))}</dcat:keyword>')
+    for language in rng.sample(LANGUAGES, rng.randint(1, 2)):
+        lines.append(f'<dct:language rdf:resource="{language}"/>')
+    lines.append(f'<dcat:landingPage rdf:resource="{uri}"/>')
+    for theme in rng.sample(range(len(THEME_LABELS)), rng.randint(0, 3)):
+        lines.append(f'<dcat:theme rdf:resource="https://data.bl.ch/theme/{theme}"/>')
+    lines.append(
+        f'<dct:accrualPeriodicity rdf:resource="http://publications.europa.eu/resource/authority/frequency/'
+        f'{rng.choice(FREQUENCIES)}"/>'
+    )
+    lines.append("<dct:spatial>Basel-Landschaft</dct:spatial>")
+    if rng.random() < 0.4:
+        lines.append(
+            f"<dct:temporal><dct:PeriodOfTime><dcat:startDate>{rng.randint(1990, 2015)}-01-01</dcat:startDate>"
+            f"<dcat:endDate>{rng.randint(2016, 2025)}-12-31</dcat:endDate></dct:PeriodOfTime></dct:temporal>"
+        )
+    for _ in range(rng.randint(1, 2)):
+        lines.append(
+            f"<dcat:contactPoint><vcard:Organization><vcard:fn>{escape(words(rng, 2))}</vcard:fn>"
+            f'<vcard:hasEmail rdf:resource="mailto:{rng.choice(["stat", "geo", "afu", "sid"])}@bl.ch"/>'
+            f"</vcard:Organization></dcat:contactPoint>"
+        )
+    if rng.random() < 0.3:
+        lines.append(f'<dct:relation rdf:resource="https://www.baselland.ch/publikationen/{number}"/>')
+    if rng.random() < 0.2:
+        lines.append(f"<dct:conformsTo rdf:resource={quoteattr(f'https://www.geo.bl.ch/modelle/{number}')}/>")
+    for index in range(rng.choice([1, 1, 2, 2, 3, 4, 6])):
+        lines.append(distribution_xml(rng, number, index))
+    lines.append("</dcat:Dataset></dcat:dataset>")
+    return "\n".join(lines)
+
+
+def write_catalog(output: TextIO, datasets: int, seed: int = 1, first_number: int = 10000):
+    """Writes a catalog of the given number of datasets (the same seed always gives the same catalog)"""
+    rng = random.Random(seed)
+    namespaces = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in NAMESPACES.items())
+    output.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<rdf:RDF {namespaces}>\n')
+    output.write('<dcat:Catalog rdf:about="https://data.bl.ch/api/explore/v2.1/catalog/exports/dcat">\n')
+    for number in range(first_number, first_number + datasets):
+        output.write(dataset_xml(rng, number))
+        output.write("\n")
+    output.write("</dcat:Catalog>\n")
+    for theme, label in enumerate(THEME_LABELS):
+        output.write(
+            f'<skos:Concept rdf:about="https://data.bl.ch/theme/{theme}">'
+            f'<skos:prefLabel xml:lang="de">{escape(label)}</skos:prefLabel></skos:Concept>\n'
+        )
+    output.write("</rdf:RDF>\n")
+
+
+def main(argv: List[str] = None):
+    arg_parser = argparse.ArgumentParser(description="Writes a synthetic data.bl.ch DCAT catalog (RDF/XML)")
+    arg_parser.add_argument("datasets", type=int, help="number of datasets, e.g. 1000, 10000 or 100000")
+    arg_parser.add_argument("output", help="path of the RDF/XML file to write")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args(argv)
+
+    with open(args.output, "w", encoding="utf-8") as output:
+        write_catalog(output, args.datasets, seed=args.seed)
+    print(f"Wrote {args.datasets} datasets to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,42 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import datetime
+import functools
 import json
 import os
-from time import time
-from typing import Any, Dict
+import random
+import threading
+from time import monotonic, perf_counter, sleep
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
 import requests
 import re
-from config import DEBUG_LOCAL_TEST, I14Y_USER_AGENT, ORGANIZATION_ID, PROXIES
+from config import (
+    DEBUG_LOCAL_TEST,
+    DEFAULT_READ_CONCURRENCY,
+    HOST_READ_CONCURRENCY,
+    I14Y_PAGE_SIZE,
+    I14Y_READ_WORKERS,
+    I14Y_USER_AGENT,
+    ORGANIZATION_ID,
+    PROXIES,
+    RETRY_AFTER_MAX,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_MAX,
+    RETRY_MAX_ATTEMPTS,
+    TOKEN_DEFAULT_LIFETIME,
+    TOKEN_REFRESH_MARGIN,
+    WRITE_CONCURRENCY,
+    WRITE_CONCURRENCY_INITIAL,
+    WRITE_CONCURRENCY_MAX,
+    WRITE_CONCURRENCY_WINDOW,
+)
+from metrics import METRICS, endpoint_label
 
 
 def reauth_if_token_expired(func):
-    """Decorator to reauth before rerunning function if token is expired"""
+    """Decorator to reauth before rerunning function if token is expired (other errors are retried by RetryPolicy)"""
 
     def wrap_func(self, *args, **kwargs):
         try:
@@ -16,24 +44,427 @@ def reauth_if_token_expired(func):
         except requests.HTTPError as e:
             print(f"{e.request.method}  {e.request.url}", flush=True)
             print(f"API error: {e.response.status_code} - {e.response.text}")
-            if e.response.status_code == 401:
-                self.api_token = self.get_access_token()
+            if e.response.status_code != 401:
+                raise
+            self.token_manager.invalidate(e.request.headers.get("Authorization"))
             return func(self, *args, **kwargs)
 
     return wrap_func
 
 
-def timer(func):
-    """Decorator that shows the execution time of the function object passed"""
+def fetch_pages(fetch_page: Callable[[Any], Any], page_keys: Iterable[Any], max_workers: int) -> List[Any]:
+    """Fetches pages concurrently (one call of fetch_page per page key) and returns the results in page order"""
+    page_keys = list(page_keys)
+    if not page_keys:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch_page, page_keys))
 
-    def wrap_func(*args, **kwargs):
-        t1 = time()
-        result = func(*args, **kwargs)
-        t2 = time()
-        print(f"Function {func.__name__!r} executed in {(t2-t1):.4f}s")
-        return result
 
-    return wrap_func
+_host_semaphores: Dict[Tuple[str, str], threading.BoundedSemaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def host_semaphore(host: str, method: str) -> threading.BoundedSemaphore:
+    """Returns the process-wide semaphore limiting concurrent reads or writes to a host"""
+    kind = "read" if method.upper() in ("GET", "HEAD", "OPTIONS") else "write"
+    with _host_semaphores_lock:
+        if (host, kind) not in _host_semaphores:
+            limit = HOST_READ_CONCURRENCY.get(host, DEFAULT_READ_CONCURRENCY) if kind == "read" else WRITE_CONCURRENCY
+            _host_semaphores[(host, kind)] = threading.BoundedSemaphore(limit)
+        return _host_semaphores[(host, kind)]
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: the limit grows by one after a window of successful calls
+    (at least WRITE_CONCURRENCY_WINDOW and at least the current limit) and is halved when the backend signals
+    backpressure (index lock failures, 429, 503).
+    Only one decrease happens per congestion event: calls started before the last decrease are ignored.
+    """
+
+    def __init__(self, name: str, initial: int = WRITE_CONCURRENCY_INITIAL, maximum: int = WRITE_CONCURRENCY_MAX):
+        self.name = name
+        self.limit = initial
+        self.maximum = maximum
+        self.peak = initial
+        self.in_flight = 0
+        self.successes = 0
+        self.generation = 0
+        self.decreases = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """Waits for a free slot and returns the generation the call started in"""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+            return self.generation
+
+    def release(self, generation: int, outcome: str):
+        """Frees a slot, outcome is one of 'success', 'backpressure' or 'neutral'"""
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.successes += 1
+                if self.successes >= max(self.limit, WRITE_CONCURRENCY_WINDOW) and self.limit < self.maximum:
+                    self.limit += 1
+                    self.peak = max(self.peak, self.limit)
+                    self.successes = 0
+            elif outcome == "backpressure" and generation == self.generation:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+                self.generation += 1
+                self.decreases += 1
+            self.condition.notify_all()
+
+    def report(self) -> str:
+        return f"{self.name}: {self.limit} (peak {self.peak}, {self.decreases} decreases)"
+
+
+_write_limiters: Dict[str, AdaptiveLimiter] = {}
+_write_limiters_lock = threading.Lock()
+
+
+def write_family(url: str) -> Optional[str]:
+    """Classifies an i14y write by endpoint family (None for writes that are not adapted, e.g. token requests)"""
+    path = urlparse(url).path
+    if "/structures" in path:
+        return "structures"
+    if path.endswith("/publication-level") or path.endswith("/registration-status"):
+        return "publication-level"
+    if "/datasets" in path:
+        return "datasets"
+    return None
+
+
+def write_limiter(family: str) -> AdaptiveLimiter:
+    """Returns the process-wide adaptive limiter of an endpoint family"""
+    with _write_limiters_lock:
+        if family not in _write_limiters:
+            _write_limiters[family] = AdaptiveLimiter(family)
+        return _write_limiters[family]
+
+
+def write_concurrency_report() -> str:
+    """Describes the write concurrency each endpoint family settled on during the run"""
+    with _write_limiters_lock:
+        limiters = list(_write_limiters.values())
+    if not limiters:
+        return "Write concurrency: no writes"
+    return "Write concurrency settled at: " + ", ".join(limiter.report() for limiter in limiters)
+
+
+# Error of iop-core when a write cannot obtain the Lucene index write lock (returned with a 500)
+LOCK_FAILURE_SIGNAL = "LockObtainFailedException"
+
+
+def is_backpressure(response: requests.Response) -> bool:
+    """
+    Checks if a response signals that the backend is overloaded: index write lock failure, rate limit (429) or
+    service unavailable (503). Other errors (e.g. 409 conflicts) are failures of the request itself
+    """
+    if response.status_code in (429, 503):
+        return True
+    return response.status_code >= 400 and LOCK_FAILURE_SIGNAL in (response.text or "")
+
+
+TRANSIENT_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class RetryPolicy:
+    """
+    Retries transient failures (connection resets, timeouts, index lock failures, 429, 503)
+    with bounded, fully jittered exponential backoff, honoring Retry-After.
+
+    Idempotent calls are simply repeated. For non-idempotent calls (e.g. POST creating a dataset),
+    before_retry is called before each new attempt: if it returns something other than None
+    (e.g. the id of the dataset the failed attempt created anyway), no retry happens and that value is returned.
+    If it raises (the outcome of the failed attempt cannot be checked), no retry happens either.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        backoff_base: float = RETRY_BACKOFF_BASE,
+        backoff_max: float = RETRY_BACKOFF_MAX,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = Counter()
+        self.gave_up = Counter()
+        self.lock = threading.Lock()
+
+    def delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before the next attempt (attempt starts at 1)"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                try:
+                    retry_at = parsedate_to_datetime(retry_after)
+                    seconds = (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    seconds = None
+            if seconds is not None:
+                return min(max(seconds, 0.0), RETRY_AFTER_MAX)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def run(self, send: Callable[[], requests.Response], description: str, before_retry: Callable[[], Any] = None):
+        """Runs send() until it returns a non-transient response or the attempts are exhausted"""
+        for attempt in range(1, self.max_attempts + 1):
+            response = None
+            try:
+                response = send()
+                if not is_backpressure(response):
+                    return response
+                reason = f"{response.status_code}"
+            except TRANSIENT_EXCEPTIONS as e:
+                if attempt == self.max_attempts:
+                    self._record(self.gave_up, description)
+                    raise
+                reason = type(e).__name__
+
+            if attempt == self.max_attempts:
+                self._record(self.gave_up, description)
+                return response
+
+            wait = self.delay(attempt, response)
+            print(f"Transient failure ({reason}) on {description}, retry {attempt} in {wait:.1f}s")
+            self._record(self.retries, description)
+            sleep(wait)
+
+            if before_retry is not None:
+                resolved = before_retry()
+                if resolved is not None:
+                    print(f"{description} already applied by the failed attempt, not retrying")
+                    return resolved
+
+    def _record(self, counter: Counter, description: str):
+        with self.lock:
+            counter[description] += 1
+
+    def report(self) -> str:
+        """Summary of the retries of the run, by method and endpoint family"""
+        with self.lock:
+            if not self.retries and not self.gave_up:
+                return "Retries: none"
+            details = ", ".join(f"{key}: {count}" for key, count in sorted(self.retries.items()))
+            report = f"Retries: {sum(self.retries.values())} ({details})"
+            if self.gave_up:
+                report += f", gave up after {self.max_attempts} attempts: {sum(self.gave_up.values())}"
+            return report
+
+
+RETRY_POLICY = RetryPolicy()
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+def retry_key(method: str, url: str) -> str:
+    """Groups requests for the retry report, e.g. 'PUT publication-level' or 'GET data.bl.ch'"""
+    return f"{method.upper()} {write_family(url) or urlparse(url).hostname}"
+
+
+class LimitedSession(requests.Session):
+    """
+    requests.Session enforcing the concurrency limits on every request:
+    i14y writes go through the adaptive limiter of their endpoint family, everything else through the per-host limits.
+
+    Idempotent requests (GET, PUT, DELETE...) are retried with RETRY_POLICY. Other requests are sent once,
+    unless idempotent=True is passed (e.g. token requests); callers retry them with RETRY_POLICY.run and a check.
+    """
+
+    def request(self, method, url, *args, idempotent: Optional[bool] = None, **kwargs):
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        send = functools.partial(self.send_limited, method, url, *args, **kwargs)
+        if not idempotent:
+            return send()
+        return RETRY_POLICY.run(send, retry_key(method, url))
+
+    def send_limited(self, method, url, *args, **kwargs):
+        family = write_family(url) if method.upper() not in ("GET", "HEAD", "OPTIONS") else None
+        if family is None:
+            with host_semaphore(urlparse(url).hostname or "", method):
+                return self.send_measured(method, url, *args, **kwargs)
+
+        limiter = write_limiter(family)
+        generation = limiter.acquire()
+        outcome = "neutral"
+        try:
+            response = self.send_measured(method, url, *args, **kwargs)
+            if response.status_code < 400:
+                outcome = "success"
+            elif is_backpressure(response):
+                outcome = "backpressure"
+            return response
+        except requests.exceptions.ConnectionError:
+            outcome = "backpressure"
+            raise
+        finally:
+            limiter.release(generation, outcome)
+
+    def send_measured(self, method, url, *args, **kwargs):
+        """Sends the request and records its latency, status code and size in METRICS"""
+        start = perf_counter()
+        response = None
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            return response
+        finally:
+            sent = received = 0
+            if response is not None:
+                body = response.request.body
+                sent = len(body) if body else 0
+                # Streamed bodies are counted as they are read (CachingReader)
+                received = 0 if kwargs.get("stream") else len(response.content or b"")
+            status = str(response.status_code) if response is not None else "error"
+            METRICS.record_request(endpoint_label(method, url), status, perf_counter() - start, sent, received)
+
+
+class CachingReader:
+    """
+    File-like wrapper around a streamed response body: everything read is also written to cache_path.
+    The previous cache file is only replaced once the body has been read to the end.
+    """
+
+    def __init__(self, response: requests.Response, cache_path: str, on_complete: Optional[Callable[[], None]] = None):
+        self.response = response
+        self.cache_path = cache_path
+        self.on_complete = on_complete
+        self.complete = False
+
+        # Let urllib3 undo any gzip/deflate content-encoding while we read the raw bytes
+        self.response.raw.decode_content = True
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.partial_path = f"{cache_path}.part"
+        self.partial_file = open(self.partial_path, "wb")
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        read_all = size is None or size < 0
+        chunk = self.response.raw.read(None if read_all else size)
+        if chunk:
+            METRICS.record_bytes(endpoint_label(self.response.request.method, self.response.url), len(chunk))
+            self.partial_file.write(chunk)
+        if (read_all or not chunk) and not self.complete:
+            self.complete = True
+            self.partial_file.close()
+            os.replace(self.partial_path, self.cache_path)
+            if self.on_complete:
+                self.on_complete()
+        return chunk
+
+    def close(self):
+        self.response.close()
+        if not self.complete:
+            self.partial_file.close()
+            if os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TokenManager:
+    """
+    Access token shared by all the API clients of the process using the same credentials.
+    The token is refreshed shortly before it expires (from expires_in) by exactly one caller, the others wait for it.
+    """
+
+    def __init__(self, token_url: str, client_key: str, client_secret: str, session: requests.Session):
+        self.token_url = token_url
+        self.client_key = client_key
+        self.client_secret = client_secret
+        self.session = session
+        self.token = None
+        self.refresh_at = 0.0
+        self.refreshes = 0
+        self.lock = threading.Lock()
+
+    def get(self) -> str:
+        """Returns a valid token, refreshing it first if it is about to expire"""
+        with self.lock:
+            if self.token is None or monotonic() >= self.refresh_at:
+                self._refresh()
+            return self.token
+
+    def invalidate(self, token: Optional[str]):
+        """Drops a token rejected by the API, unless another caller already replaced it"""
+        with self.lock:
+            if token is None or token == self.token:
+                self.token = None
+
+    def _refresh(self):
+        data = {"grant_type": "client_credentials"}
+        response = self.session.post(
+            self.token_url,
+            data=data,
+            auth=(self.client_key, self.client_secret),
+            idempotent=True,
+        )
+        if response.status_code >= 400:
+            raise Exception("Failed to get token")
+        body = response.json()
+        expires_in = float(body.get("expires_in") or TOKEN_DEFAULT_LIFETIME)
+        self.token = "Bearer " + body["access_token"]
+        self.refresh_at = monotonic() + expires_in - min(TOKEN_REFRESH_MARGIN, expires_in / 2)
+        self.refreshes += 1
+
+
+_token_managers: Dict[Tuple[str, str], TokenManager] = {}
+_token_managers_lock = threading.Lock()
+
+
+def get_token_manager(token_url: str, client_key: str, client_secret: str, session: requests.Session) -> TokenManager:
+    """Returns the process-wide token manager of a set of credentials"""
+    with _token_managers_lock:
+        if (token_url, client_key) not in _token_managers:
+            _token_managers[(token_url, client_key)] = TokenManager(token_url, client_key, client_secret, session)
+        return _token_managers[(token_url, client_key)]
+
+
+class CatalogSnapshot:
+    """
+    In-process copy of the organization's i14y datasets, listed once per run.
+    The harvester records the datasets it creates and deletes, so that the structure import can reuse it.
+    """
+
+    def __init__(self, datasets: Iterable[Dict]):
+        self.lock = threading.Lock()
+        self.datasets: Dict[str, Dict] = {dataset["id"]: dataset for dataset in datasets}
+
+    def add(self, identifier: str, dataset_id: str):
+        """Records a dataset created during the run"""
+        with self.lock:
+            self.datasets.setdefault(dataset_id, {"id": dataset_id, "identifiers": [identifier]})
+
+    def remove(self, dataset_id: str):
+        """Records a dataset deleted during the run"""
+        with self.lock:
+            self.datasets.pop(dataset_id, None)
+
+    def identifier_id_map(self) -> Dict[str, str]:
+        """identifier -> i14y id for every identifier of the datasets"""
+        with self.lock:
+            return {
+                identifier: dataset["id"] for dataset in self.datasets.values() for identifier in dataset["identifiers"]
+            }
+
+    def identifier_dataset_map(self) -> Dict[str, Dict]:
+        """first identifier -> dataset"""
+        with self.lock:
+            return {dataset["identifiers"][0]: dataset for dataset in self.datasets.values()}
 
 
 class CommonI14YAPI:
@@ -59,8 +490,10 @@ class CommonI14YAPI:
             self.client_secret = api_params["client_secret"]
             self.identifier_pattern = api_params["identifier_pattern"]
             self.datasets_file_path = os.path.join(os.getcwd(), "OGD_BL", "data", "datasets.json")
+            # Kept between runs (restored from the workflow cache)
+            self.state_dir = os.path.join(os.getcwd(), "OGD_BL", "state")
 
-            self.session = requests.Session()
+            self.session = LimitedSession()
 
             if DEBUG_LOCAL_TEST:
                 self.session.verify = False
@@ -68,7 +501,9 @@ class CommonI14YAPI:
             else:
                 self.session.verify = True
 
-            self.api_token = self.get_access_token()
+            self.token_manager = get_token_manager(
+                self.api_get_token_url, self.client_key, self.client_secret, self.session
+            )
         except (KeyError, TypeError):
             exception_str = "You need to provide the following parameters in a dict:"
             exception_str += "\n- client_key: client key to generate token"
@@ -81,51 +516,98 @@ class CommonI14YAPI:
             )
             raise Exception(exception_str)
 
+    @property
+    def api_token(self) -> str:
+        """Valid access token, generated from client key and client secret by the shared token manager"""
+        return self.token_manager.get()
+
     def get_access_token(self):
-        """Generated an access token from client key and client secret"""
-        data = {"grant_type": "client_credentials"}
-        response = self.session.post(
-            self.api_get_token_url,
-            data=data,
-            auth=(self.client_key, self.client_secret),
-        )
-        if response.status_code >= 400:
-            raise Exception("Failed to get token")
-        return "Bearer " + response.json()["access_token"]
+        """Returns a valid access token (only requests a new one when the current one is about to expire)"""
+        return self.token_manager.get()
 
+    @METRICS.timed("listing")
     @reauth_if_token_expired
-    def get_all_existing_datasets(self, publisherIdentifier: str, pageSize: int = 25) -> str:
-        """Gets all existing datasets in one request"""
+    def get_all_existing_datasets(
+        self,
+        publisherIdentifier: str,
+        pageSize: int = I14Y_PAGE_SIZE,
+        identifier_id_map: Optional[Dict[str, str]] = None,
+    ) -> List[Dict]:
+        """
+        Gets all existing datasets: the last page is probed for (the i14y listing returns no total),
+        then the remaining pages are fetched concurrently.
+        If identifier_id_map is given, it is filled with identifier -> i14y id as the pages arrive.
+        """
 
         print(f"Fetching all existing datasets from I14Y for organization {publisherIdentifier}...")
 
-        all_datasets = []
-
         url = f"{self.api_base_url}/datasets"
         headers = {"Authorization": self.api_token, "Accept": "application/json", "User-Agent": I14Y_USER_AGENT}
-        i = 1
-        has_more = True
+        datasets_by_page: Dict[int, List[Dict]] = {}
+        page_sizes: Dict[int, int] = {}
 
-        while has_more:
+        def fetch_page(page: int) -> Optional[Dict]:
+            if page in page_sizes:
+                return None
             params = {
                 "publisherIdentifier": publisherIdentifier,
                 "pageSize": pageSize,
-                "page": i,
+                "page": page,
             }
             response = self.session.get(url, params=params, headers=headers)
             response.raise_for_status()
             data = response.json()
-            for dataset in data["data"]:
-                identifier = dataset["identifiers"][0]
-                if self.identifier_pattern.match(identifier):
-                    all_datasets.append(dataset)
+            datasets = [dataset for dataset in data["data"] if self.identifier_pattern.match(dataset["identifiers"][0])]
+            if identifier_id_map is not None:
+                for dataset in datasets:
+                    for identifier in dataset["identifiers"]:
+                        identifier_id_map[identifier] = dataset["id"]
+            datasets_by_page[page] = datasets
+            page_sizes[page] = len(data["data"])
+            return data
+
+        fetch_page(1)
+        last_page = 1
+        if page_sizes[1] >= pageSize:
+            last_page = self._probe_last_page(fetch_page, page_sizes, pageSize)
+            fetch_pages(fetch_page, range(2, last_page + 1), I14Y_READ_WORKERS)
 
-            i += 1
-            has_more = len(data["data"]) > 0
+        all_datasets = []
+        seen_ids = set()
+        for page in range(1, last_page + 1):
+            for dataset in datasets_by_page[page]:
+                if dataset["id"] not in seen_ids:
+                    seen_ids.add(dataset["id"])
+                    all_datasets.append(dataset)
 
-        print(f"Fetched {len(all_datasets)} datasets from i14y for organization {ORGANIZATION_ID}")
+        print(f"Fetched {len(all_datasets)} datasets from i14y for organization {ORGANIZATION_ID} ({last_page} pages)")
         return all_datasets
 
+    @staticmethod
+    def _probe_last_page(fetch_page: Callable[[int], Any], page_sizes: Dict[int, int], pageSize: int) -> int:
+        """
+        Finds the last non-empty page: doubles the page number until a page is not full,
+        then bisects. Full pages read while probing are kept, so only a few probes can come back empty.
+        """
+        last_full = 1
+        page = 2
+        while True:
+            fetch_page(page)
+            if page_sizes[page] < pageSize:
+                break
+            last_full = page
+            page *= 2
+
+        low, high = last_full, page  # low is full, high is not full
+        while high - low > 1:
+            middle = (low + high) // 2
+            fetch_page(middle)
+            if page_sizes[middle] < pageSize:
+                high = middle
+            else:
+                low = middle
+        return high if page_sizes[high] > 0 else low
+
     def save_data(self, data: Dict[str, Any], file_path: str) -> None:
         """Saves data to a JSON file."""
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -1,7 +1,16 @@
 import os
 
-# OGD canton Basel-Landschaft API
-API_BL_URL = "https://data.bl.ch/api/explore/v2.1/catalog/exports/dcat"
+# OGD canton Basel-Landschaft API (BL_BASE_URL can point to a local stand-in, see i14y_stub_server.py)
+BL_BASE_URL = os.environ.get("BL_BASE_URL", "https://data.bl.ch")
+API_BL_URL = f"{BL_BASE_URL}/api/explore/v2.1/catalog/exports/dcat"
+
+# Paging of the data.bl.ch catalog endpoints (reads are not rate limited, so pages are fetched concurrently)
+ODS_PAGE_SIZE = 100
+ODS_READ_WORKERS = 8
+
+# The structure import reads the metadata of all data.bl.ch datasets at once (catalog pages) if it processes
+# at least this many datasets, otherwise it requests the metadata of each dataset
+ODS_BULK_METADATA_MIN_DATASETS = 10
 
 # I14Y API configuration
 API_BASE_URL_DEV = "https://iop-partner-d.app.cfap02.atlantica.admin.ch/api"
@@ -26,6 +35,12 @@ DEFAULT_DESCRIPTION = {"de": "Export der Daten"}
 EXCLUDED_MEDIA_TYPES = ["application/pdf"]
 EXCLUDED_FORMAT_CODES = ["PDF"]
 
+# Number of texts (descriptions, titles, labels) whose HTML to text conversion is memoized
+HTML_TEXT_CACHE_SIZE = 8192
+
+# Number of date values whose normalization is memoized
+DATE_CACHE_SIZE = 8192
+
 
 # File format (.xml and .rdf -> "xml", .ttl -> "ttl")
 FILE_FORMAT = "xml"
@@ -36,10 +51,69 @@ I14Y_USER_AGENT = "I14Y BL Harvester (contact: i14y@bfs.admin.ch)"
 DEBUG_LOCAL_TEST = os.environ.get("DEBUG_LOCAL_TEST", "false") == "true"
 PROXIES = {"http": "http://proxy-bvcol.admin.ch:8080", "https": "http://proxy-bvcol.admin.ch:8080"}
 
+# Parse the DCAT export one dcat:Dataset element at a time instead of loading it into a single graph
+STREAM_DCAT_EXPORT = os.environ.get("STREAM_DCAT_EXPORT", "false") == "true"
+
+# Number of worker processes extracting the datasets of a parsed catalog (0 or 1: extraction in the main process)
+EXTRACT_PROCESSES = int(os.environ.get("EXTRACT_PROCESSES", "0"))
+
 # Useful when e.g. we have to change the parsing of the description
 UPDATE_ALL = os.environ.get("UPDATE_ALL", "false") == "true"
 
-# TODO Sergiy: increase max_workers from 1 once we have fixed Lucene index write lock issues in iop-core
-MAX_WORKERS = 1
+# Modules that build the payloads: an unmodified DCAT export is harvested again if one of them changed since the
+# last complete run (their hash is recorded with the cached export, see HarvesterBL.mark_export_completed)
+PAYLOAD_SOURCE_FILES = [
+    "config.py",
+    "mappings.py",
+    "dcat_properties_importer.py",
+    "payload.py",
+    "utils.py",
+    "harvester.py",
+]
+
+# Structures are only re-uploaded when the generated SHACL changed (timestamps aside), unless this is set
+FORCE_STRUCTURE_UPLOAD = os.environ.get("FORCE_STRUCTURE_UPLOAD", "false") == "true"
+
+# With IMPORT_STRUCTURES, structures are imported while the harvest runs: the datasets created or updated go
+# through a queue of STRUCTURE_QUEUE_SIZE (the harvest waits when it is full) to the structure builder threads
+PIPELINE_STRUCTURE_IMPORT = os.environ.get("PIPELINE_STRUCTURE_IMPORT", "false") == "true"
+STRUCTURE_QUEUE_SIZE = 64
+
+# Concurrent writes to i14y are adapted per endpoint family (datasets, publication-level, structures) because
+# of the Lucene index write lock errors in iop-core: each family starts at WRITE_CONCURRENCY_INITIAL, gains one
+# slot after WRITE_CONCURRENCY_WINDOW successful writes and is halved on index lock failures, 429 or 503 responses.
+WRITE_CONCURRENCY_INITIAL = 1
+WRITE_CONCURRENCY_MAX = int(os.environ.get("WRITE_CONCURRENCY_MAX", "8"))
+WRITE_CONCURRENCY_WINDOW = 20
+
+# Listing of the existing i14y datasets: page size and number of pages fetched concurrently
+I14Y_PAGE_SIZE = 100
+I14Y_READ_WORKERS = 4
+
+# Worker threads of the harvest, delete and structure import phases (the writes are limited as described above)
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", str(WRITE_CONCURRENCY_MAX)))
+
+# Maximum number of concurrent requests per host, shared by all API clients of the process.
+# Reads (GET/HEAD) and writes are limited separately: data.bl.ch reads can run at high concurrency
+# while other writes (e.g. token requests) stay serialized.
+HOST_READ_CONCURRENCY = {"data.bl.ch": 16}
+DEFAULT_READ_CONCURRENCY = 4
+WRITE_CONCURRENCY = 1
+
+# Retries of transient failures (connection errors, index lock failures, 429, 503): bounded exponential backoff
+# with full jitter, a Retry-After header from the server takes precedence
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 30.0
+RETRY_AFTER_MAX = 120.0
+
+# Access tokens are refreshed this many seconds before they expire (lifetime used when expires_in is missing)
+TOKEN_REFRESH_MARGIN = 30
+TOKEN_DEFAULT_LIFETIME = 300
+
+# Metrics of the run (stage durations, request latencies, status codes, bytes), written next to harvest_log.txt
+METRICS_JSON_FILE = "harvest_metrics.json"
+METRICS_PROMETHEUS_FILE = "harvest_metrics.prom"
+REQUEST_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
 
 DESCRIPTION_CONFORMSTO_PREFIX = "conformsTo:"
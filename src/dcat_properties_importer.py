@@ -1,7 +1,9 @@
 from config import *
 from utils import *
 from mappings import *
+from payload import DatasetPayload, DistributionPayload
 from rdflib import URIRef, Literal, Graph
+from rdflib.term import Node
 from rdflib.namespace import DCTERMS, FOAF, RDFS, DCAT, RDF, SKOS
 from rdflib import Namespace
 
@@ -14,12 +16,157 @@ SPDX = Namespace("http://spdx.org/rdf/terms#")
 dcat3 = Namespace("http://www.w3.org/ns/dcat#")
 
 from urllib.parse import urlparse
-from typing import Optional, List, Dict, Set
+from typing import BinaryIO, Iterable, Iterator, Optional, List, Dict, Set, Tuple, Union
+from collections import deque
+from functools import lru_cache
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import re
+import xml.etree.ElementTree as ET
+
+# Clark notation names used by the streaming RDF/XML reader
+_RDF_RDF = f"{{{RDF}}}RDF"
+_RDF_ABOUT = f"{{{RDF}}}about"
+_RDF_RESOURCE = f"{{{RDF}}}resource"
+_RDF_TYPE = f"{{{RDF}}}type"
+_RDF_DESCRIPTION = f"{{{RDF}}}Description"
+_XML_BASE = "{http://www.w3.org/XML/1998/namespace}base"
+_DCAT_DATASET = f"{{{DCAT}}}Dataset"
+_DCAT_CATALOG = f"{{{DCAT}}}Catalog"
+# Properties whose object nodes are read by the extraction (distributions, contact points, periods, labels):
+# a dataset referencing such a node with rdf:resource is only yielded by iter_dataset_graphs once the node is read
+_DEREFERENCED_PROPERTIES = {
+    f"{{{DCAT}}}distribution",
+    f"{{{DCAT}}}contactPoint",
+    f"{{{DCAT}}}theme",
+    f"{{{DCTERMS}}}temporal",
+    f"{{{DCTERMS}}}coverage",
+    f"{{{DCTERMS}}}relation",
+    f"{{{DCTERMS}}}conformsTo",
+}
+
+# Serialized top-level node, with the URIs it references: all of them, and those read by the extraction
+_AuxiliaryNode = Tuple[bytes, Set[str], Set[str]]
+# Dataset waiting for a node: position in the document, rdf:about, serialized element and its references
+_DeferredDataset = Tuple[int, str, bytes, Set[str], Set[str]]
+
+
+class GraphIndex:
+    """
+    Read-only subject -> predicate -> objects view of an RDF graph, built with a single scan of its triples.
+    It offers the graph lookups used by the get_* helpers (objects, value, triple in graph) as dict lookups.
+    Triples are read subject by subject so that objects keep the order in which rdflib returns them
+    (iterating the whole graph at once does not).
+    """
+
+    __slots__ = ("index",)
+
+    def __init__(self, graph: Optional[Graph] = None):
+        self.index: Dict[Node, Dict[Node, List[Node]]] = {}
+        if graph is not None:
+            for subject in graph.subjects(unique=True):
+                predicates = self.index[subject] = {}
+                for predicate, obj in graph.predicate_objects(subject):
+                    predicates.setdefault(predicate, []).append(obj)
+
+    @classmethod
+    def from_triples(cls, triples: Iterable[Tuple[Node, Node, Node]]) -> "GraphIndex":
+        """Index of a list of triples, objects keep the order of the list"""
+        graph_index = cls()
+        for subject, predicate, obj in triples:
+            graph_index.index.setdefault(subject, {}).setdefault(predicate, []).append(obj)
+        return graph_index
+
+    def subjects(self, predicate: Node, obj: Node) -> List[Node]:
+        return [subject for subject, predicates in self.index.items() if obj in predicates.get(predicate, ())]
+
+    def bundle(self, subject: Node, boundaries: Set[Node]) -> List[Tuple[Node, Node, Node]]:
+        """
+        Triples describing a subject: its own triples and those of every node reachable from it
+        (distributions, contact points, themes...), without crossing into the boundary nodes (other datasets).
+        """
+        triples = []
+        seen = {subject}
+        pending = deque([subject])
+        while pending:
+            node = pending.popleft()
+            for predicate, objects in self.index.get(node, {}).items():
+                for obj in objects:
+                    triples.append((node, predicate, obj))
+                    if obj in self.index and obj not in seen and obj not in boundaries:
+                        seen.add(obj)
+                        pending.append(obj)
+        return triples
+
+    def objects(self, subject: Node, predicate: Node) -> List[Node]:
+        return self.index.get(subject, {}).get(predicate, [])
+
+    def value(self, subject: Node, predicate: Node) -> Optional[Node]:
+        objects = self.objects(subject, predicate)
+        return objects[0] if objects else None
+
+    def __contains__(self, triple: Tuple[Node, Node, Node]) -> bool:
+        subject, predicate, obj = triple
+        return obj in self.objects(subject, predicate)
+
+
+def index_graph(graph: Union[Graph, GraphIndex]) -> GraphIndex:
+    """Returns the index of a graph (indexing a whole catalog graph once is up to the caller)"""
+    return graph if isinstance(graph, GraphIndex) else GraphIndex(graph)
+
+
+# Index of the catalog inherited by forked extraction workers
+_worker_graph: Optional[GraphIndex] = None
+
+
+def _set_worker_graph(graph: GraphIndex):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def extract_dataset_in_worker(dataset_uri: URIRef) -> Optional[Dict]:
+    """Extracts a dataset from the index inherited by a forked worker process"""
+    return extract_dataset(_worker_graph, dataset_uri)
+
+
+def extract_dataset_bundle(bundle: Tuple[URIRef, List[Tuple[Node, Node, Node]]]) -> Optional[Dict]:
+    """Extracts a dataset from its triple bundle (see GraphIndex.bundle) in a worker process"""
+    dataset_uri, triples = bundle
+    return extract_dataset(GraphIndex.from_triples(triples), dataset_uri)
+
+
+def extract_datasets_in_processes(graph: GraphIndex, dataset_uris: List[URIRef], processes: int) -> List[Optional[Dict]]:
+    """
+    Extracts datasets on several cores, the results are returned in the order of dataset_uris.
+    Where processes can be forked the workers inherit the index and only receive dataset URIs,
+    otherwise every dataset is shipped to the workers as a self-contained triple bundle.
+    """
+    chunksize = max(1, len(dataset_uris) // (processes * 4))
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_set_worker_graph,
+            initargs=(graph,),
+        ) as executor:
+            return list(executor.map(extract_dataset_in_worker, dataset_uris, chunksize=chunksize))
+
+    boundaries = set(graph.subjects(RDF.type, DCAT.Dataset))
+    bundles = [(dataset_uri, graph.bundle(dataset_uri, boundaries)) for dataset_uri in dataset_uris]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(extract_dataset_bundle, bundles, chunksize=chunksize))
+
+
+def extract_dataset(graph: Union[Graph, GraphIndex], dataset_uri: URIRef) -> Optional[Dict]:
+    """Extracts dataset details from RDF graph."""
+    dataset = build_dataset_payload(graph, dataset_uri)
+    return dataset.to_dict() if dataset is not None else None
 
 
-def extract_dataset(graph: Graph, dataset_uri: URIRef) -> Optional[Dict]:
-    """Extracts dataset details from RDF graph."""
+def build_dataset_payload(graph: Union[Graph, GraphIndex], dataset_uri: URIRef) -> Optional[DatasetPayload]:
+    """Reads a dataset from RDF graph into its payload object (empty fields are pruned by its to_dict)."""
+    graph = index_graph(graph)
     distributions = extract_distributions(graph, dataset_uri)
 
     if not has_valid_distributions(distributions):
@@ -27,66 +174,69 @@ def extract_dataset(graph: Graph, dataset_uri: URIRef) -> Optional[Dict]:
         return None
 
     original_identifier = get_literal(graph, dataset_uri, DCTERMS.identifier)
-    dataset_number = None
-    if original_identifier and "/dataset/" in original_identifier:
-        dataset_number = original_identifier.split("/dataset/")[-1].rstrip("/")
+    dataset_number = get_dataset_number(original_identifier)
 
     new_identifier = f"CH_KT_BL_dataset_{dataset_number}" if dataset_number else original_identifier
     identifiers = [new_identifier] if dataset_number else [original_identifier]
 
-    dataset = {
-        "identifiers": identifiers,
-        "title": get_multilingual_literal(graph, dataset_uri, DCTERMS.title),
-        "description": get_multilingual_literal(graph, dataset_uri, DCTERMS.description),
-        "accessRights": {"code": "PUBLIC"},
-        "issued": get_literal(graph, dataset_uri, DCTERMS.issued, is_date=True),
-        "modified": get_literal(graph, dataset_uri, DCTERMS.modified, is_date=True),
-        "publisher": DEFAULT_PUBLISHER,
-        "landingPages": get_resource_list(graph, dataset_uri, DCAT.landingPage),
-        "keywords": get_multilingual_keywords(graph, dataset_uri, DCAT.keyword),
-        "distributions": [dist for dist in distributions if is_valid_distribution(dist)],
-        "languages": get_languages(graph, dataset_uri, DCTERMS.language),
-        "contactPoints": extract_contact_points(graph, dataset_uri),
-        "documentation": get_resource_list(graph, dataset_uri, FOAF.page),
-        "images": get_resource_list(graph, dataset_uri, SCHEMA.image),
-        "temporalCoverage": get_temporal_coverage(graph, dataset_uri),
-        "frequency": get_frequency(graph, dataset_uri),
-        "isReferencedBy": get_is_referenced_by(graph, dataset_uri),
-        "relations": get_relations(graph, dataset_uri),
-        "spatial": get_spatial(graph, dataset_uri),
-        "version": get_literal(graph, dataset_uri, dcat3.version),
-        "versionNotes": get_multilingual_literal(graph, dataset_uri, ADMS.versionNotes),
-        "conformsTo": get_conforms_to(graph, dataset_uri),
-        "themes": get_themes(graph, dataset_uri, DCAT.theme),
-        "qualifiedRelations": (
+    dataset = DatasetPayload(
+        identifiers=identifiers,
+        title=get_multilingual_literal(graph, dataset_uri, DCTERMS.title),
+        description=get_multilingual_literal(graph, dataset_uri, DCTERMS.description),
+        accessRights={"code": "PUBLIC"},
+        issued=get_literal(graph, dataset_uri, DCTERMS.issued, is_date=True),
+        modified=get_literal(graph, dataset_uri, DCTERMS.modified, is_date=True),
+        publisher=DEFAULT_PUBLISHER,
+        landingPages=get_resource_list(graph, dataset_uri, DCAT.landingPage),
+        keywords=get_multilingual_keywords(graph, dataset_uri, DCAT.keyword),
+        distributions=[dist for dist in distributions if is_valid_distribution(dist)],
+        languages=get_languages(graph, dataset_uri, DCTERMS.language),
+        contactPoints=extract_contact_points(graph, dataset_uri),
+        documentation=get_resource_list(graph, dataset_uri, FOAF.page),
+        images=get_resource_list(graph, dataset_uri, SCHEMA.image),
+        temporalCoverage=get_temporal_coverage(graph, dataset_uri),
+        frequency=get_frequency(graph, dataset_uri),
+        isReferencedBy=get_is_referenced_by(graph, dataset_uri),
+        relations=get_relations(graph, dataset_uri),
+        spatial=get_spatial(graph, dataset_uri),
+        version=get_literal(graph, dataset_uri, dcat3.version),
+        versionNotes=get_multilingual_literal(graph, dataset_uri, ADMS.versionNotes),
+        conformsTo=get_conforms_to(graph, dataset_uri),
+        themes=get_themes(graph, dataset_uri, DCAT.theme),
+        qualifiedRelations=(
             [
                 {
                     "hadRole": {"code": "original"},
-                    "relation": {"uri": get_literal(graph, dataset_uri, DCTERMS.identifier)},
+                    "relation": {"uri": original_identifier},
                 }
             ]
-            if get_literal(graph, dataset_uri, DCTERMS.identifier)
+            if original_identifier
             else []
         ),
-    }
-
-    if not dataset["frequency"]:
-        del dataset["frequency"]
+    )
 
-    if not dataset["description"]:
+    if not dataset.description:
         print("no description found")
         return None
 
-    return remove_empty_fields(dataset)
+    return dataset
 
 
-def extract_distributions(graph: Graph, dataset_uri: URIRef) -> List[Dict]:
+def get_dataset_number(original_identifier: Optional[str]) -> Optional[str]:
+    """Returns the data.bl.ch dataset number from the original identifier (https://data.bl.ch/.../dataset/<number>/)."""
+    if original_identifier and "/dataset/" in original_identifier:
+        return original_identifier.split("/dataset/")[-1].rstrip("/")
+    return None
+
+
+def extract_distributions(graph: GraphIndex, dataset_uri: URIRef) -> List[DistributionPayload]:
     """Extracts distributions for a dataset."""
     distributions = []
     for distribution_uri in graph.objects(dataset_uri, DCAT.distribution):
         title = get_multilingual_literal(graph, distribution_uri, DCTERMS.title) or DEFAULT_TITLE
         description = get_multilingual_literal(graph, distribution_uri, DCTERMS.description) or DEFAULT_DESCRIPTION
         media_type_uri = get_single_resource(graph, distribution_uri, DCAT.mediaType)
+        media_type_code = get_media_type(media_type_uri) if media_type_uri else None
         format_uri = get_single_resource(graph, distribution_uri, DCTERMS.format)
 
         format_code = None
@@ -110,29 +260,27 @@ def extract_distributions(graph: Graph, dataset_uri: URIRef) -> List[Dict]:
         checksum_value = get_literal(graph, distribution_uri, SPDX.checksumValue)
         packaging_format = get_literal(graph, distribution_uri, DCAT.packageFormat)
 
-        distribution = {
-            "title": title,
-            "description": description,
-            "format": {"code": format_code} if format_code and format_code in VALID_FORMAT_CODES else None,
-            "downloadUrl": (
+        distribution = DistributionPayload(
+            title=title,
+            description=description,
+            format={"code": format_code} if format_code and format_code in VALID_FORMAT_CODES else None,
+            downloadUrl=(
                 {"label": download_title, "uri": download_url if download_url is not None else common_url}
                 if common_url is not None
                 else None
             ),
-            "mediaType": (
-                {"code": get_media_type(media_type_uri)} if media_type_uri and get_media_type(media_type_uri) else None
-            ),
-            "accessUrl": {"label": download_title, "uri": common_url} if common_url is not None else None,
-            "license": {"code": valid_license} if valid_license is not None else None,
-            "availability": (
+            mediaType={"code": media_type_code} if media_type_code else None,
+            accessUrl={"label": download_title, "uri": common_url} if common_url is not None else None,
+            license={"code": valid_license} if valid_license is not None else None,
+            availability=(
                 {"code": get_availability_code(availability_uri)} if availability_uri is not None else None
             ),
-            "issued": get_literal(graph, distribution_uri, DCTERMS.issued, is_date=True),
-            "modified": get_literal(graph, distribution_uri, DCTERMS.modified, is_date=True),
-            "rights": get_literal(graph, distribution_uri, DCTERMS.rights),
-            "accessServices": get_access_services(graph, distribution_uri),
-            "byteSize": get_literal(graph, distribution_uri, DCAT.byteSize),
-            "checksum": (
+            issued=get_literal(graph, distribution_uri, DCTERMS.issued, is_date=True),
+            modified=get_literal(graph, distribution_uri, DCTERMS.modified, is_date=True),
+            rights=get_literal(graph, distribution_uri, DCTERMS.rights),
+            accessServices=get_access_services(graph, distribution_uri),
+            byteSize=get_literal(graph, distribution_uri, DCAT.byteSize),
+            checksum=(
                 {
                     "algorithm": {"code": checksum_algorithm} if checksum_algorithm is not None else None,
                     "checksumValue": checksum_value,
@@ -140,73 +288,84 @@ def extract_distributions(graph: Graph, dataset_uri: URIRef) -> List[Dict]:
                 if checksum_algorithm is not None or checksum_value is not None
                 else None
             ),
-            "conformsTo": get_conforms_to(graph, distribution_uri),
-            "coverage": get_coverage(graph, distribution_uri),
-            "documentation": get_resource_list(graph, distribution_uri, FOAF.page),
-            "identifier": get_literal(graph, distribution_uri, DCTERMS.identifier),
-            "images": get_resource_list(graph, distribution_uri, SCHEMA.image),
-            "languages": get_languages(graph, distribution_uri, DCTERMS.language),
-            "packagingFormat": {"code": packaging_format} if packaging_format is not None else None,
-            "spatialResolution": get_literal(graph, distribution_uri, DCAT.spatialResolutionInMeters),
-            "temporalResolution": get_literal(graph, distribution_uri, DCAT.temporalResolution),
-        }
-
-        distributions.append(remove_empty_fields(distribution))
+            conformsTo=get_conforms_to(graph, distribution_uri),
+            coverage=get_coverage(graph, distribution_uri),
+            documentation=get_resource_list(graph, distribution_uri, FOAF.page),
+            identifier=get_literal(graph, distribution_uri, DCTERMS.identifier),
+            images=get_resource_list(graph, distribution_uri, SCHEMA.image),
+            languages=get_languages(graph, distribution_uri, DCTERMS.language),
+            packagingFormat={"code": packaging_format} if packaging_format is not None else None,
+            spatialResolution=get_literal(graph, distribution_uri, DCAT.spatialResolutionInMeters),
+            temporalResolution=get_literal(graph, distribution_uri, DCAT.temporalResolution),
+        )
+
+        distributions.append(distribution)
     return distributions
 
 
-def is_valid_distribution(distribution: Dict) -> bool:
+def is_valid_distribution(distribution: DistributionPayload) -> bool:
     """Check if a distribution is valid (not PDF)."""
-    if distribution.get("mediaType") is None:
+    if distribution.mediaType is None:
         return False
 
-    media_code = distribution["mediaType"].get("code", "").lower()
+    media_code = distribution.mediaType.get("code", "").lower()
     if media_code in EXCLUDED_MEDIA_TYPES:
         return False
 
-    format_dict = distribution.get("format")
+    format_dict = distribution.format
     if format_dict is not None and format_dict.get("code") in EXCLUDED_FORMAT_CODES:
         return False
 
     return True
 
 
-def has_valid_distributions(distributions: List[Dict]) -> bool:
+def has_valid_distributions(distributions: List[DistributionPayload]) -> bool:
     """Check if a dataset has at least one valid distribution."""
     return any(is_valid_distribution(dist) for dist in distributions) if distributions else False
 
 
-def get_languages(graph: Graph, subject: URIRef, predicate: URIRef) -> List[Dict]:
+def get_languages(graph: GraphIndex, subject: URIRef, predicate: URIRef) -> List[Dict]:
     """Retrieves a list of i14y codes for languages."""
     return [
         {"code": code}
         for lang_uri in graph.objects(subject, predicate)
-        for code, uris in LANGUAGES_MAPPING.items()
-        if str(lang_uri) in uris
+        for code in LANGUAGE_CODES_BY_URI.get(str(lang_uri), ())
     ]
 
 
-def html_to_text_preserve_structure(html: str) -> str:
-    s = html
-
-    # Convert links: <a href="URL">Text</a> -> Text (URL)
-    s = re.sub(
-        r'<a\b[^>]*href=["\']([^"\']+)["\'][^>]*>(.*?)</a>',
-        r"\2 (\1) ",
-        s,
-        flags=re.IGNORECASE | re.DOTALL,
-    )
+# Links: <a href="URL">Text</a> -> Text (URL)
+_HTML_LINK = re.compile(r'<a\b[^>]*href=["\']([^"\']+)["\'][^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL)
+# Tags turned into line breaks: bullet points, end of lists, paragraph breaks and <br>
+_HTML_BREAK_RULES = [
+    (re.compile(r"<li\b[^>]*>", re.IGNORECASE), "\n- "),
+    (re.compile(r"</li\s*>", re.IGNORECASE), "\n"),
+    (re.compile(r"</ul\s*>|</ol\s*>", re.IGNORECASE), "\n\n"),
+    (re.compile(r"</p\s*>", re.IGNORECASE), "\n\n"),
+    (re.compile(r"<br\s*/?>", re.IGNORECASE), "\n"),
+]
+_HTML_BREAKS = re.compile("|".join(f"({pattern.pattern})" for pattern, _ in _HTML_BREAK_RULES), re.IGNORECASE)
+_SPACES_BEFORE_NEWLINE = re.compile(r"[ \t]+\n")
+_NEWLINES = re.compile(r"\n{3,}")
+_SPACES = re.compile(r" {2,}")
 
-    # Preserve bullet points
-    s = re.sub(r"<li\b[^>]*>", "\n- ", s, flags=re.IGNORECASE)
-    s = re.sub(r"</li\s*>", "\n", s, flags=re.IGNORECASE)
-    s = re.sub(r"</ul\s*>|</ol\s*>", "\n\n", s, flags=re.IGNORECASE)
 
-    # Preserve paragraph breaks
-    s = re.sub(r"</p\s*>", "\n\n", s, flags=re.IGNORECASE)
+def _replace_html_breaks(s: str) -> str:
+    """Replaces the break tags in a single pass, in the order of _HTML_BREAK_RULES where a replacement forms a new tag"""
+    replaced = _HTML_BREAKS.sub(lambda match: _HTML_BREAK_RULES[match.lastindex - 1][1], s)
+    if _HTML_BREAKS.search(replaced) is None:
+        return replaced
+
+    for pattern, replacement in _HTML_BREAK_RULES:
+        s = pattern.sub(replacement, s)
+    return s
+
+
+@lru_cache(maxsize=HTML_TEXT_CACHE_SIZE)
+def html_to_text_preserve_structure(html: str) -> str:
+    s = _HTML_LINK.sub(r"\2 (\1) ", html)
 
-    # Preserve <br>
-    s = re.sub(r"<br\s*/?>", "\n", s, flags=re.IGNORECASE)
+    # Preserve bullet points, paragraph breaks and <br>
+    s = _replace_html_breaks(s)
 
     # Remove remaining HTML
     s = remove_html_tags(s)
@@ -215,14 +374,14 @@ def html_to_text_preserve_structure(html: str) -> str:
     s = s.replace("\xa0", " ")
 
     # Normalize whitespace
-    s = re.sub(r"[ \t]+\n", "\n", s)  # remove spaces before newline
-    s = re.sub(r"\n{3,}", "\n\n", s)  # max two consecutive newlines
-    s = re.sub(r" {2,}", " ", s)  # collapse multiple spaces
+    s = _SPACES_BEFORE_NEWLINE.sub("\n", s)  # remove spaces before newline
+    s = _NEWLINES.sub("\n\n", s)  # max two consecutive newlines
+    s = _SPACES.sub(" ", s)  # collapse multiple spaces
 
     return s.strip()
 
 
-def get_multilingual_literal(graph: Graph, subject: URIRef, predicate: URIRef) -> Dict[str, str]:
+def get_multilingual_literal(graph: GraphIndex, subject: URIRef, predicate: URIRef) -> Dict[str, str]:
     """Retrieves multilingual literals from RDF graph."""
     values = {lang: "" for lang in SUPPORTED_LANGUAGES}
     for obj in graph.objects(subject, predicate):
@@ -235,7 +394,7 @@ def get_multilingual_literal(graph: Graph, subject: URIRef, predicate: URIRef) -
     return {lang: value for lang, value in values.items() if value}
 
 
-def get_literal(graph: Graph, subject: URIRef, predicate: URIRef, is_date: bool = False) -> Optional[str]:
+def get_literal(graph: GraphIndex, subject: URIRef, predicate: URIRef, is_date: bool = False) -> Optional[str]:
     """Retrieves a single value from the RDF graph."""
     value = graph.value(subject, predicate)
     if value is None:
@@ -245,18 +404,18 @@ def get_literal(graph: Graph, subject: URIRef, predicate: URIRef, is_date: bool
     return format_date(value_str) if is_date else value_str
 
 
-def get_single_resource(graph: Graph, subject: URIRef, predicate: URIRef) -> Optional[str]:
+def get_single_resource(graph: GraphIndex, subject: URIRef, predicate: URIRef) -> Optional[str]:
     """Retrieves a single resource (URI) for a given predicate."""
     uri = graph.value(subject, predicate)
     return normalize_uri(str(uri)) if uri is not None else None
 
 
-def get_resource_list(graph: Graph, subject: URIRef, predicate: URIRef) -> List[Dict]:
+def get_resource_list(graph: GraphIndex, subject: URIRef, predicate: URIRef) -> List[Dict]:
     """Retrieves a list of resources (URIs) for a given predicate."""
     return [{"uri": normalize_uri(str(uri))} for uri in graph.objects(subject, predicate)]
 
 
-def get_multilingual_keywords(graph: Graph, subject: URIRef, predicate: URIRef) -> List[Dict]:
+def get_multilingual_keywords(graph: GraphIndex, subject: URIRef, predicate: URIRef) -> List[Dict]:
     """Retrieves only keywords with explicit language tags."""
     return [
         {"label": {str(lang): str(keyword_obj)}}
@@ -269,17 +428,17 @@ def get_media_type(media_type_uri: Optional[str]) -> Optional[str]:
     """Returns the media type code if it's a valid URI or direct code."""
     if media_type_uri is None:
         return None
-    if media_type_uri in MEDIA_TYPE_MAPPING.values():
+    if media_type_uri in MEDIA_TYPE_CODES:
         return media_type_uri
     return MEDIA_TYPE_MAPPING.get(str(media_type_uri))
 
 
-def get_access_services(graph: Graph, subject: URIRef) -> List[Dict]:
+def get_access_services(graph: GraphIndex, subject: URIRef) -> List[Dict]:
     """Retrieves accessServices from RDF graph."""
     return [{"id": normalize_uri(str(obj))} for obj in graph.objects(subject, DCAT.accessService)]
 
 
-def get_coverage(graph: Graph, subject: URIRef) -> List[Dict]:
+def get_coverage(graph: GraphIndex, subject: URIRef) -> List[Dict]:
     """Retrieves temporal coverage from RDF graph, only accepting PeriodOfTime objects.
     Skips rdf:resource and other non-PeriodOfTime coverage declarations."""
     coverage_data = []
@@ -302,32 +461,49 @@ def get_coverage(graph: Graph, subject: URIRef) -> List[Dict]:
     return coverage_data
 
 
-def get_spatial(graph: Graph, dataset_uri: URIRef) -> List[str]:
+def get_spatial(graph: GraphIndex, dataset_uri: URIRef) -> List[str]:
     """Retrieves spatial values as a list of strings."""
     return [str(spatial) for spatial in graph.objects(dataset_uri, DCTERMS.spatial)] or []
 
 
-def get_frequency(graph: Graph, subject: URIRef) -> Optional[Dict]:
+def get_frequency(graph: GraphIndex, subject: URIRef) -> Optional[Dict]:
     """Retrieves frequency from RDF graph."""
     frequency_uri = get_single_resource(graph, subject, DCTERMS.accrualPeriodicity)
     return {"code": VOCAB_EU_FREQUENCY[frequency_uri.split("/")[-1]]} if frequency_uri else None
 
 
-def get_themes(graph: Graph, subject: URIRef, predicate: URIRef) -> List[Dict]:
+# Theme URI -> codes resolved from its skos:prefLabel, shared by all the datasets of the catalog
+_theme_codes_by_uri: Dict[URIRef, List[str]] = {}
+
+
+@lru_cache(maxsize=None)
+def get_theme_codes(theme_label: str) -> List[str]:
+    """Returns the i14y theme codes of a theme label (labels of THEME_MAPPING are matched as substrings)."""
+    if theme_label in THEME_CODES_BY_LABEL:
+        return THEME_CODES_BY_LABEL[theme_label]
+    return [code for code, labels in THEME_MAPPING.items() if theme_label in labels]
+
+
+def get_themes(graph: GraphIndex, subject: URIRef, predicate: URIRef) -> List[Dict]:
     """Retrieves unique theme codes from RDF graph."""
     unique_codes: Set[str] = set()
     themes: List[Dict] = []
 
     for theme in graph.objects(subject, predicate):
-        theme_codes = set()
+        # Codes are kept in THEME_MAPPING order so that the payload (and its fingerprint) is stable between runs
+        theme_codes: List[str] = []
 
         if isinstance(theme, Literal):
-            theme_codes.add(str(theme))
+            theme_codes.append(str(theme))
+        elif theme in _theme_codes_by_uri:
+            theme_codes.extend(_theme_codes_by_uri[theme])
         else:
-            pref_label = next(graph.objects(theme, SKOS.prefLabel), None)
+            pref_label = graph.value(theme, SKOS.prefLabel)
             if pref_label is not None:
-                theme_label = str(pref_label)
-                theme_codes.update(code for code, labels in THEME_MAPPING.items() if theme_label in labels)
+                theme_codes.extend(get_theme_codes(str(pref_label)))
+                # Blank nodes are local to a graph, only URIs can be resolved once for all datasets
+                if isinstance(theme, URIRef):
+                    _theme_codes_by_uri[theme] = get_theme_codes(str(pref_label))
 
         for code in theme_codes:
             if code not in unique_codes:
@@ -341,31 +517,28 @@ def get_availability_code(availability_uri: Optional[str]) -> Optional[str]:
     """Maps availability URI to corresponding code."""
     if availability_uri is None:
         return None
-    return next((code for code, uris in VOCAB_EU_PLANNED_AVAILABILITY.items() if availability_uri in uris), None)
+    return AVAILABILITY_CODE_BY_URI.get(availability_uri)
 
 
-def get_temporal_coverage(graph: Graph, subject: URIRef) -> List[Dict]:
+def get_temporal_coverage(graph: GraphIndex, subject: URIRef) -> List[Dict]:
     """Retrieves temporal coverage data from RDF graph."""
-    return [
-        {
-            "start": get_literal(graph, obj, DCAT.startDate, is_date=True),
-            "end": get_literal(graph, obj, DCAT.endDate, is_date=True),
-        }
-        for obj in graph.objects(subject, DCTERMS.temporal)
-        if (obj, RDF.type, URIRef("http://purl.org/dc/terms/PeriodOfTime")) in graph
-        and (
-            get_literal(graph, obj, DCAT.startDate, is_date=True) is not None
-            or get_literal(graph, obj, DCAT.endDate, is_date=True) is not None
-        )
-    ]
+    temporal_coverage = []
+    for obj in graph.objects(subject, DCTERMS.temporal):
+        if (obj, RDF.type, DCTERMS.PeriodOfTime) not in graph:
+            continue
+        start = get_literal(graph, obj, DCAT.startDate, is_date=True)
+        end = get_literal(graph, obj, DCAT.endDate, is_date=True)
+        if start is not None or end is not None:
+            temporal_coverage.append({"start": start, "end": end})
+    return temporal_coverage
 
 
-def get_is_referenced_by(graph: Graph, subject: URIRef) -> List[Dict]:
+def get_is_referenced_by(graph: GraphIndex, subject: URIRef) -> List[Dict]:
     """Retrieves isReferencedBy from RDF graph."""
     return [{"uri": normalize_uri(str(obj))} for obj in graph.objects(subject, DCTERMS.isReferencedBy)]
 
 
-def get_relations(graph: Graph, subject: URIRef) -> List[Dict]:
+def get_relations(graph: GraphIndex, subject: URIRef) -> List[Dict]:
     """Retrieves relations from RDF graph."""
     relations = []
     for obj in graph.objects(subject, DCTERMS.relation):
@@ -382,7 +555,7 @@ def get_relations(graph: Graph, subject: URIRef) -> List[Dict]:
     return relations
 
 
-def get_conforms_to(graph: Graph, subject: URIRef) -> List[Dict]:
+def get_conforms_to(graph: GraphIndex, subject: URIRef) -> List[Dict]:
     """Retrieves conformsTo from RDF graph."""
     return [
         {"label": get_multilingual_literal(graph, obj, RDFS.label), "uri": normalize_uri(str(obj))}
@@ -390,7 +563,7 @@ def get_conforms_to(graph: Graph, subject: URIRef) -> List[Dict]:
     ]
 
 
-def extract_contact_points(graph: Graph, dataset_uri: URIRef) -> List[Dict]:
+def extract_contact_points(graph: GraphIndex, dataset_uri: URIRef) -> List[Dict]:
     """Extracts contact points from RDF."""
     DEFAULT_LANGUAGES = {lang: "" for lang in SUPPORTED_LANGUAGES}
 
@@ -414,3 +587,156 @@ def extract_contact_points(graph: Graph, dataset_uri: URIRef) -> List[Dict]:
                 }
             )
     return contact_points
+
+
+def _is_node_of_type(elem: ET.Element, type_tag: str) -> bool:
+    """Checks if an RDF/XML node element is typed, either as typed node or with an rdf:type child."""
+    if elem.tag == type_tag:
+        return True
+    if elem.tag != _RDF_DESCRIPTION:
+        return False
+    type_uri = type_tag[1:].replace("}", "")
+    return any(child.tag == _RDF_TYPE and child.get(_RDF_RESOURCE) == type_uri for child in elem)
+
+
+def _node_references(elem: ET.Element) -> Tuple[Set[str], Set[str]]:
+    """rdf:resource references of a node element and its nested nodes: all, and those read by the extraction"""
+    references: Set[str] = set()
+    dereferenced: Set[str] = set()
+    for node in elem.iter():
+        uri = node.get(_RDF_RESOURCE)
+        if uri:
+            references.add(uri)
+            if node.tag in _DEREFERENCED_PROPERTIES:
+                dereferenced.add(uri)
+    return references, dereferenced
+
+
+def _resolve_references(
+    references: Set[str], dereferenced: Set[str], auxiliary_nodes: Dict[str, _AuxiliaryNode]
+) -> Tuple[List[bytes], Set[str]]:
+    """
+    Top-level nodes referenced by a dataset, followed recursively (e.g. a distribution node referencing a checksum
+    node), and the references read by the extraction whose node has not been read yet
+    """
+    nodes: List[bytes] = []
+    missing: Set[str] = set()
+    visited: Set[int] = set()
+    pending = [(references, dereferenced)]
+    while pending:
+        references, dereferenced = pending.pop()
+        for uri in references:
+            node = auxiliary_nodes.get(uri)
+            if node is None:
+                if uri in dereferenced:
+                    missing.add(uri)
+            elif id(node) not in visited:
+                visited.add(id(node))
+                nodes.append(node[0])
+                pending.append((node[1], node[2]))
+    return nodes, missing
+
+
+def iter_dataset_graphs(source: BinaryIO) -> Iterator[Tuple[URIRef, Graph]]:
+    """
+    Streams an RDF/XML DCAT export and yields a (dataset_uri, graph) pair for every dcat:Dataset element,
+    as soon as the element is closed and the nodes it references have been read. Each graph contains the triples of
+    the dataset element (distributions, contact points, temporal coverage... nested in it) and of the top-level nodes
+    it references with rdf:resource (e.g. skos:Concept themes), followed recursively.
+
+    A dataset referencing a node read by the extraction (_DEREFERENCED_PROPERTIES) that appears later in the
+    document is kept, serialized, until that node is read. The datasets still waiting at the end of the document
+    reference nodes defined outside of it and are yielded as they are. Memory grows with the top-level nodes that are
+    neither a catalog nor a dataset and with the datasets waiting, not with the number of datasets.
+    """
+    stack: List[ET.Element] = []
+    catalog_nodes: Set[int] = set()
+    open_datasets = 0
+    xml_base = None
+    # rdf:about of a top-level node, or of a node nested in it -> top-level node
+    auxiliary_nodes: Dict[str, _AuxiliaryNode] = {}
+    # URI of a node not read yet -> datasets waiting for it (each dataset waits for one node at a time)
+    waiting: Dict[str, List[_DeferredDataset]] = {}
+    deferred = 0
+
+    def dataset_graph(dataset: ET.Element, nodes: List[bytes]) -> Graph:
+        wrapper = ET.Element(_RDF_RDF)
+        if xml_base:
+            wrapper.set(_XML_BASE, xml_base)
+        wrapper.append(dataset)
+        for node in nodes:
+            wrapper.append(ET.fromstring(node))
+        graph = Graph()
+        graph.parse(data=ET.tostring(wrapper), format="xml", publicID=xml_base)
+        return graph
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == _DCAT_DATASET:
+                open_datasets += 1
+            elif len(stack) == 1:
+                xml_base = elem.get(_XML_BASE)
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+
+        if _is_node_of_type(elem, _DCAT_DATASET):
+            if elem.tag == _DCAT_DATASET:
+                open_datasets -= 1
+
+            about = elem.get(_RDF_ABOUT)
+            if about is None:
+                print("Skipping dataset element without rdf:about")
+            else:
+                references, dereferenced = _node_references(elem)
+                nodes, missing = _resolve_references(references, dereferenced, auxiliary_nodes)
+                if missing:
+                    deferred += 1
+                    dataset = (deferred, about, ET.tostring(elem), references, dereferenced)
+                    waiting.setdefault(min(missing), []).append(dataset)
+                else:
+                    yield URIRef(about), dataset_graph(elem, nodes)
+
+            # Nested datasets stay in their parent element so that the parent graph is complete
+            if open_datasets == 0:
+                elem.clear()
+                if parent is not None:
+                    parent.remove(elem)
+
+        elif len(stack) == 1:
+            # Top-level node: keep vocabulary nodes for the datasets referencing them, drop everything else
+            about = elem.get(_RDF_ABOUT)
+            if about and elem.tag != _DCAT_CATALOG and id(elem) not in catalog_nodes:
+                node = (ET.tostring(elem), *_node_references(elem))
+                defined = [nested.get(_RDF_ABOUT) for nested in elem.iter() if nested.get(_RDF_ABOUT)]
+                for uri in defined:
+                    auxiliary_nodes.setdefault(uri, node)
+                auxiliary_nodes[about] = node
+
+                for uri in defined:
+                    for dataset in waiting.pop(uri, []):
+                        _, dataset_about, data, references, dereferenced = dataset
+                        nodes, missing = _resolve_references(references, dereferenced, auxiliary_nodes)
+                        if missing:
+                            waiting.setdefault(min(missing), []).append(dataset)
+                        else:
+                            yield URIRef(dataset_about), dataset_graph(ET.fromstring(data), nodes)
+            elem.clear()
+            stack[0].remove(elem)
+
+        elif len(stack) == 2 and (parent.tag == _DCAT_CATALOG or id(parent) in catalog_nodes):
+            # Catalog property (e.g. dcat:dataset wrapper), its datasets have already been yielded
+            elem.clear()
+            parent.remove(elem)
+
+        elif len(stack) == 2 and elem.tag == _RDF_TYPE and elem.get(_RDF_RESOURCE) == str(DCAT.Catalog):
+            catalog_nodes.add(id(parent))
+            parent.remove(elem)
+
+    # The nodes still missing are not defined in the document
+    remaining = sorted((dataset for datasets in waiting.values() for dataset in datasets), key=lambda d: d[0])
+    for _, about, data, references, dereferenced in remaining:
+        nodes, _ = _resolve_references(references, dereferenced, auxiliary_nodes)
+        yield URIRef(about), dataset_graph(ET.fromstring(data), nodes)
@@ -1,24 +1,48 @@
 import requests
-from common import CommonI14YAPI, reauth_if_token_expired
+from common import (
+    RETRY_POLICY,
+    CachingReader,
+    CatalogSnapshot,
+    CommonI14YAPI,
+    fetch_pages,
+    reauth_if_token_expired,
+    retry_key,
+    write_concurrency_report,
+)
 from config import *
 from dcat_properties_importer import *
 from rdflib import Graph
 from rdflib.namespace import DCAT, RDF
 import json
 import os
-from dateutil import parser
-from typing import Dict, Any, List
+from typing import BinaryIO, Callable, Dict, Any, Iterator, List, Optional
 import datetime
+import hashlib
 import time
 import urllib3
 import traceback
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import argparse
+
 from structure_importer import StructureImporter
+from journal import RunJournal
+from metrics import METRICS
+from utils import parse_date, payload_fingerprint
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
+def payload_code_version() -> str:
+    """Hash of the modules that build the payloads (PAYLOAD_SOURCE_FILES), line endings aside"""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in PAYLOAD_SOURCE_FILES:
+        with open(os.path.join(directory, name), "rb") as file:
+            digest.update(file.read().replace(b"\r\n", b"\n"))
+    return digest.hexdigest()
+
+
 class HarvesterBL(CommonI14YAPI):
 
     def __init__(self, api_params):
@@ -32,8 +56,27 @@ class HarvesterBL(CommonI14YAPI):
         - identifier_pattern: re.compile object with the pattern used to identify the dataset on i14y
         """
         super().__init__(api_params)
-
-    def get_opendatasoft_tags(self, original_identifier, base_url="https://data.bl.ch"):
+        self.opendatasoft_tag_index = {}
+        # Number of datasets of the data.bl.ch catalog, known once the tag index has been built
+        self.ods_catalog_total = None
+        # identifier -> fingerprint of the last payload submitted to i14y
+        self.fingerprints_file_path = os.path.join(self.state_dir, "fingerprints.json")
+        self.fingerprints = {}
+        # Last DCAT export and its validators (ETag, Last-Modified), used for conditional downloads
+        self.export_cache_path = os.path.join(self.state_dir, "dcat_export.xml")
+        self.export_cache_meta_path = os.path.join(self.state_dir, "dcat_export.json")
+        self.export_not_modified = False
+        # Version of the payload code, recorded with the cached export once it has been harvested completely
+        self.payload_version = payload_code_version()
+        # i14y datasets listed by the last harvest, reused by the structure import
+        self.catalog_snapshot = None
+        # Set by harvest(resume=True)
+        self.resuming = False
+        # Operations completed by the current run, replayed by --resume if it does not complete
+        self.journal = RunJournal(os.path.join(self.state_dir, "harvest_journal.jsonl"))
+
+    @METRICS.timed("tag_lookup")
+    def get_opendatasoft_tags(self, original_identifier, base_url=BL_BASE_URL):
         url = f"{base_url}/api/datasets/1.0/{original_identifier}/?format=json"
         response = self.session.get(url)
         response.raise_for_status()
@@ -41,45 +84,201 @@ class HarvesterBL(CommonI14YAPI):
         tags = data.get("metas", {}).get("tags")
         return tags
 
-    def fetch_datasets_from_api(self) -> List[Dict]:
+    def build_opendatasoft_tag_index(self, base_url=BL_BASE_URL) -> Dict[str, List[str]]:
+        """Pages once through the data.bl.ch catalog and builds a datasetid -> tags map"""
+        url = f"{base_url}/api/datasets/1.0/search/"
+
+        def fetch_page(start):
+            params = {"rows": ODS_PAGE_SIZE, "start": start, "format": "json"}
+            response = self.session.get(url, params=params, timeout=60)
+            response.raise_for_status()
+            return response.json()
+
+        first_page = fetch_page(0)
+        total = first_page.get("nhits", 0)
+        self.ods_catalog_total = total
+        pages = [first_page] + fetch_pages(fetch_page, range(ODS_PAGE_SIZE, total, ODS_PAGE_SIZE), ODS_READ_WORKERS)
+
+        tag_index = {}
+        for page in pages:
+            for ods_dataset in page.get("datasets", []):
+                tag_index[ods_dataset["datasetid"]] = ods_dataset.get("metas", {}).get("tags") or []
+
+        print(f"Fetched tags of {len(tag_index)} datasets from {base_url}")
+        return tag_index
+
+    @METRICS.timed("tag_lookup")
+    def load_opendatasoft_tag_index(self):
+        """Builds the tag index, datasets missing from it are looked up one by one"""
+        try:
+            self.opendatasoft_tag_index = self.build_opendatasoft_tag_index()
+        except requests.exceptions.RequestException as e:
+            print(f"Could not build tag index, falling back to one request per dataset: {e}")
+            self.opendatasoft_tag_index = {}
+
+    def get_dataset_tags(self, ods_identifier: str) -> Optional[List[str]]:
+        """Returns the Opendatasoft tags of a dataset from the tag index"""
+        if ods_identifier in self.opendatasoft_tag_index:
+            return self.opendatasoft_tag_index[ods_identifier]
+        return self.get_opendatasoft_tags(ods_identifier)
+
+    def is_published_dataset(self, graph: GraphIndex, dataset_uri: URIRef) -> bool:
+        """Checks if a dataset is tagged for opendata.swiss"""
+        print(f"Processing dataset URI: {dataset_uri}")
+        original_identifier = get_literal(graph, dataset_uri, DCTERMS.identifier)
+        if not original_identifier:
+            print(f"Skipping dataset without identifier: {dataset_uri}")
+            return False
+
+        ods_identifier = get_dataset_number(original_identifier) or original_identifier
+        tags = self.get_dataset_tags(ods_identifier)
+        if not (tags and "opendata.swiss" in tags):
+            print(f"Skipping dataset without opendata.swiss tag: {dataset_uri}")
+            return False
+
+        return True
+
+    def extract_published_dataset(self, graph: GraphIndex, dataset_uri: URIRef) -> Optional[Dict]:
+        """Extracts a dataset if it is tagged for opendata.swiss (the tag is checked before the extraction)"""
+        if not self.is_published_dataset(graph, dataset_uri):
+            return None
+
+        with METRICS.stage("extract"):
+            dataset = extract_dataset(graph, dataset_uri)
+        if dataset and isinstance(dataset, dict):
+            return dataset
+
+        print(f"Skipping invalid dataset: {dataset_uri}")
+        return None
+
+    def open_dcat_export(self) -> Optional[BinaryIO]:
+        """
+        Opens the DCAT export as a binary stream. The request is conditional on the validators of the cached copy:
+        on 304 the cached copy is returned, otherwise the body is streamed and cached while it is read.
+        """
+        meta = self.load_data(self.export_cache_meta_path) if os.path.exists(self.export_cache_path) else {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(
+            API_BL_URL,
+            headers=headers,
+            timeout=60,  # Generous timeout for potentially large response
+            stream=True,
+        )
+
+        if response.status_code == 304:
+            response.close()
+            print("DCAT export not modified since last run, using cached copy")
+            self.export_not_modified = True
+            return open(self.export_cache_path, "rb")
+
+        self.export_not_modified = False
+        if response.status_code != 200:
+            print(f"Error: Received status code {response.status_code}")
+            response.close()
+            return None
+
+        new_meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "completed": False,
+        }
+        return CachingReader(
+            response,
+            self.export_cache_path,
+            on_complete=lambda: self.save_data(new_meta, self.export_cache_meta_path),
+        )
+
+    def last_run_completed(self) -> bool:
+        """Checks if the last harvest of the cached DCAT export finished cleanly, with the current payload code"""
+        if not os.path.exists(self.export_cache_meta_path):
+            return False
+        meta = self.load_data(self.export_cache_meta_path)
+        if not meta.get("completed", False):
+            return False
+        if meta.get("payload_version") != self.payload_version:
+            print("Payload code changed since the last complete run, harvesting the cached DCAT export again")
+            return False
+        return True
+
+    def mark_export_completed(self, payload_version: str):
+        """Records that the cached DCAT export has been harvested completely with this version of the payload code"""
+        meta = self.load_data(self.export_cache_meta_path)
+        if meta:
+            meta["completed"] = True
+            meta["payload_version"] = payload_version
+            self.save_data(meta, self.export_cache_meta_path)
+
+    def iter_datasets_from_api(self, export: Optional[BinaryIO] = None) -> Iterator[Dict]:
+        """Streams the DCAT export and yields every published dataset as soon as its record has been parsed"""
+        if export is None:
+            export = self.open_dcat_export()
+            if export is None:
+                return
+
+        with export:
+            # When streaming, the download is recorded with the parse
+            for dataset_uri, graph in METRICS.timed_iter("parse", iter_dataset_graphs(export)):
+                dataset = self.extract_published_dataset(GraphIndex(graph), dataset_uri)
+                if dataset:
+                    yield dataset
+
+    def fetch_datasets_from_api(self, export: Optional[BinaryIO] = None) -> List[Dict]:
         """Fetches all available datasets from the DCAT API in a single request"""
         datasets = []
 
         try:
-            response = self.session.get(
-                API_BL_URL,
-                timeout=60,  # Generous timeout for potentially large response
-            )
+            if export is None:
+                export = self.open_dcat_export()
+                if export is None:
+                    return datasets
 
-            if response.status_code != 200:
-                print(f"Error: Received status code {response.status_code}")
+            self.load_opendatasoft_tag_index()
+
+            if STREAM_DCAT_EXPORT:
+                for dataset in self.iter_datasets_from_api(export):
+                    datasets.append(dataset)
+                print(f"Successfully processed {len(datasets)} datasets")
                 return datasets
 
-            if not response.text.strip():
+            with export, METRICS.stage("download"):
+                data = export.read()
+
+            if not data.strip():
                 print("Received empty response")
                 return datasets
 
-            graph = Graph()
-            graph.parse(data=response.text, format="xml")
+            with METRICS.stage("parse"):
+                graph = Graph()
+                graph.parse(data=data, format="xml")
 
-            # Get all dataset URIs
-            dataset_uris = list(graph.subjects(RDF.type, DCAT.Dataset))
-            print(f"Found {len(dataset_uris)} datasets to process")
+                # Get all dataset URIs
+                dataset_uris = list(graph.subjects(RDF.type, DCAT.Dataset))
+                print(f"Found {len(dataset_uris)} datasets to process")
 
-            # Process each dataset
-            for dataset_uri in dataset_uris:
-                print(f"Processing dataset URI: {dataset_uri}")
-                dataset = extract_dataset(graph, dataset_uri)
+                # Index the graph once, the extraction of every dataset reads from the index
+                index = GraphIndex(graph)
 
-                if dataset and isinstance(dataset, dict):
-                    original_identifier = dataset["identifiers"][0].removeprefix("CH_KT_BL_dataset_")
-                    tags = self.get_opendatasoft_tags(original_identifier)
-                    if tags and "opendata.swiss" in tags:
+            if EXTRACT_PROCESSES > 1:
+                # Tags are checked here, only the extraction runs in the worker processes
+                published_uris = [uri for uri in dataset_uris if self.is_published_dataset(index, uri)]
+                with METRICS.stage("extract"):
+                    extracted = extract_datasets_in_processes(index, published_uris, EXTRACT_PROCESSES)
+                for dataset_uri, dataset in zip(published_uris, extracted):
+                    if dataset and isinstance(dataset, dict):
                         datasets.append(dataset)
                     else:
-                        print(f"Skipping dataset without opendata.swiss tag: {dataset_uri}")
-                else:
-                    print(f"Skipping invalid dataset: {dataset_uri}")
+                        print(f"Skipping invalid dataset: {dataset_uri}")
+            else:
+                # Process each dataset
+                for dataset_uri in dataset_uris:
+                    dataset = self.extract_published_dataset(index, dataset_uri)
+                    if dataset:
+                        datasets.append(dataset)
 
         except requests.exceptions.RequestException as e:
             print(f"Network error during request: {e}")
@@ -103,10 +302,18 @@ class HarvesterBL(CommonI14YAPI):
         graph.parse(file_path, format=FILE_FORMAT)
         self.fix_bad_resource_literals(graph)
 
+        index = GraphIndex(graph)
+        dataset_uris = list(graph.subjects(RDF.type, DCAT.Dataset))
+
+        if EXTRACT_PROCESSES > 1:
+            extracted = extract_datasets_in_processes(index, dataset_uris, EXTRACT_PROCESSES)
+        else:
+            extracted = None
+
         datasets = []
-        for dataset_uri in graph.subjects(RDF.type, DCAT.Dataset):
+        for position, dataset_uri in enumerate(dataset_uris):
             print(f"Processing dataset URI: {dataset_uri}")
-            dataset = extract_dataset(graph, dataset_uri)
+            dataset = extracted[position] if extracted is not None else extract_dataset(index, dataset_uri)
 
             if dataset and isinstance(dataset, dict):
                 datasets.append(dataset)
@@ -121,6 +328,7 @@ class HarvesterBL(CommonI14YAPI):
             raise ValueError("Dataset must be a dictionary.")
         return {"data": dataset}
 
+    @METRICS.timed("publication_level")
     @reauth_if_token_expired
     def change_level_i14y(self, id, level):
         """Change publication level of a dataset in i14y"""
@@ -141,6 +349,7 @@ class HarvesterBL(CommonI14YAPI):
             if "The resource already has its publication level set to" not in str(txt):
                 raise
 
+    @METRICS.timed("publication_level")
     @reauth_if_token_expired
     def change_status_i14y(self, id, status):
         """Change registration status of a dataset in i14y"""
@@ -176,16 +385,32 @@ class HarvesterBL(CommonI14YAPI):
 
         return response
 
-    def get_all_identifier_id_map(self, datasets):
-        all_existing_datasets_identifier_id_map = {}
+    @reauth_if_token_expired
+    def find_dataset_id(self, identifier) -> Optional[str]:
+        """
+        Looks up the i14y id of a dataset by identifier, None if it does not exist.
+        Relies on the datasetIdentifier filter of the listing: if the API returns datasets with other identifiers,
+        it ignored the filter and the answer is unknown, so an exception is raised (no create is retried on a guess)
+        """
+        if not identifier:
+            return None
+        response = self.session.get(
+            f"{self.api_base_url}/datasets",
+            params={"publisherIdentifier": self.organization, "datasetIdentifier": identifier},
+            headers={"Authorization": self.api_token, "Accept": "application/json", "User-Agent": I14Y_USER_AGENT},
+        )
+        response.raise_for_status()
+        datasets = response.json().get("data", [])
         for dataset in datasets:
-            dataset_id = dataset["id"]
-            dataset_identifiers = dataset["identifiers"]
-            for identifier in dataset_identifiers:
-                all_existing_datasets_identifier_id_map[identifier] = dataset_id
-
-        return all_existing_datasets_identifier_id_map
+            if identifier in dataset.get("identifiers", []):
+                return dataset["id"]
+        if datasets:
+            raise Exception(
+                f"Cannot tell if dataset {identifier} exists: the i14y listing ignored the datasetIdentifier filter"
+            )
+        return None
 
+    @METRICS.timed("submit")
     @reauth_if_token_expired
     def submit_to_api(self, payload, identifier=None, previous_ids=None):
         """Submits the dataset payload to the API."""
@@ -207,7 +432,14 @@ class HarvesterBL(CommonI14YAPI):
             action = "updated"
         else:
             url = f"{self.api_base_url}/datasets"
-            response = self.session.post(url, json=payload, headers=headers)
+            # A create is not idempotent: only retry it if the failed attempt did not create the dataset anyway
+            response = RETRY_POLICY.run(
+                lambda: self.session.post(url, json=payload, headers=headers),
+                retry_key("POST", url),
+                before_retry=lambda: self.find_dataset_id(identifier),
+            )
+            if isinstance(response, str):
+                return response, action
 
         if response.status_code not in {200, 201, 204}:
             response.raise_for_status()
@@ -219,88 +451,327 @@ class HarvesterBL(CommonI14YAPI):
 
     def parse_date(self, date_str):
         """Safely parse a date string, returning None if invalid or missing"""
-        if not date_str:
-            return None
-        try:
-            return parser.parse(date_str)
-        except (ValueError, TypeError):
-            return None
+        return parse_date(date_str)
 
-    def _process_one_dataset(self, dataset, all_existing_map, yesterday):
+    def plan_dataset(self, dataset: Dict, all_existing_map: Dict[str, str], yesterday: datetime.datetime) -> Dict:
+        """
+        Decides what the harvest does with a dataset, without writing to i14y.
+        Returns the plan entry: action ("create", "update" or "unchanged") and its reason, the payload of the
+        datasets to submit and the payload fingerprint
+        """
         identifier = dataset["identifiers"][0]
+        payload = self.create_dataset_payload(dataset)
+        fingerprint = payload_fingerprint(payload)
+        previous_fingerprint = self.fingerprints.get(identifier)
+        existing_dataset_id = all_existing_map.get(identifier)
+
+        if existing_dataset_id is None:
+            action, reason = "create", "new dataset"
+        elif UPDATE_ALL:
+            action, reason = "update", "UPDATE_ALL"
+        elif previous_fingerprint is not None:
+            if fingerprint != previous_fingerprint:
+                action, reason = "update", "payload changed"
+            else:
+                action, reason = "unchanged", "same payload"
+        else:
+            # No fingerprint yet for this dataset (first run with the fingerprint store): rely on the modified date
+            modified_date = self.parse_date(dataset.get("modified"))
+            if modified_date and modified_date > yesterday:
+                action, reason = "update", f"no fingerprint, modified {dataset.get('modified')}"
+            else:
+                action, reason = "unchanged", "no fingerprint, not modified since yesterday"
+
+        entry = {
+            "identifier": identifier,
+            "action": action,
+            "reason": reason,
+            "dataset_id": existing_dataset_id,
+            "fingerprint": fingerprint,
+        }
+        if action != "unchanged":
+            entry["payload"] = payload
+        return entry
 
-        print(f"\nProcessing dataset: {identifier}")
-        print(f"Issued date: {dataset.get('issued')}")
-        print(f"Modified date: {dataset.get('modified')}")
-
-        modified_date = self.parse_date(dataset.get("modified"))
-        created_date = self.parse_date(dataset.get("issued", dataset.get("modified")))
-
-        is_new_dataset = identifier not in all_existing_map.keys()
-        is_updated_dataset = UPDATE_ALL or modified_date and modified_date > yesterday
-
-        existing_dataset_id = all_existing_map[identifier] if identifier in all_existing_map.keys() else None
-
-        if existing_dataset_id and not is_updated_dataset:
-            return {"status": "unchanged", "identifier": identifier, "dataset_id": existing_dataset_id}
-
-        elif is_new_dataset or is_updated_dataset:
-            action = "created" if is_new_dataset else "updated"
-            print(f"{action.capitalize()} dataset detected: {identifier}")
+    def apply_dataset(self, entry: Dict, all_existing_map: Dict[str, str]) -> Dict:
+        """Executes the plan entry of a dataset (see plan_dataset)"""
+        identifier = entry["identifier"]
+        fingerprint = entry["fingerprint"]
 
-            payload = self.create_dataset_payload(dataset)
-            response_id, action = self.submit_to_api(payload, identifier, all_existing_map)
-            response_id = response_id.strip('"')
+        print(f"\nProcessing dataset: {identifier}")
 
+        if self.journal.done("submit", identifier, fingerprint=fingerprint):
+            # Already submitted by the interrupted run (--resume)
+            submitted = self.journal.get("submit", identifier)
+            response_id, action = submitted["dataset_id"], submitted["action"]
             if action == "created":
-                self.change_level_i14y(response_id, "Public")
-                self.change_status_i14y(response_id, "Recorded")
-
-            print(f"Success - Dataset {action}: {response_id}\n")
-
+                self.publish_new_dataset(response_id)
+            self.fingerprints[identifier] = fingerprint
+            print(f"Dataset already {action} before the run was interrupted: {response_id}\n")
             return {"status": action, "identifier": identifier, "dataset_id": response_id}
 
-        return {"status": "skipped", "identifier": identifier, "dataset_id": None}
-
+        if entry["action"] == "unchanged":
+            # The store only holds submitted payloads: without a fingerprint, this payload was never sent
+            return {"status": "unchanged", "identifier": identifier, "dataset_id": entry["dataset_id"]}
+
+        print(f"{entry['action'].capitalize()} dataset detected: {identifier} ({entry['reason']})")
+
+        if entry["action"] == "create" and self.resuming:
+            # The interrupted run may have created it without journaling it: do not create it twice
+            created_id = self.find_dataset_id(identifier)
+            if created_id:
+                self.journal.record("submit", identifier, dataset_id=created_id, action="created", fingerprint=fingerprint)
+                self.publish_new_dataset(created_id)
+                self.fingerprints[identifier] = fingerprint
+                print(f"Dataset already created before the run was interrupted: {created_id}\n")
+                return {"status": "created", "identifier": identifier, "dataset_id": created_id}
+
+        response_id, action = self.submit_to_api(entry["payload"], identifier, all_existing_map)
+        response_id = response_id.strip('"')
+        if self.journal.done("submit", identifier, action="created"):
+            # Created by the interrupted run, which may not have published it
+            action = "created"
+        self.journal.record("submit", identifier, dataset_id=response_id, action=action, fingerprint=fingerprint)
+
+        if action == "created":
+            self.publish_new_dataset(response_id)
+
+        self.fingerprints[identifier] = fingerprint
+        print(f"Success - Dataset {action}: {response_id}\n")
+
+        return {"status": action, "identifier": identifier, "dataset_id": response_id}
+
+    def publish_new_dataset(self, dataset_id):
+        """Sets the publication level and registration status of a created dataset (unless journaled)"""
+        if not self.journal.done("level", dataset_id, level="Public"):
+            self.change_level_i14y(dataset_id, "Public")
+            self.journal.record("level", dataset_id, level="Public")
+        if not self.journal.done("status", dataset_id, status="Recorded"):
+            self.change_status_i14y(dataset_id, "Recorded")
+            self.journal.record("status", dataset_id, status="Recorded")
+
+    @METRICS.timed("delete")
     def _delete_one_dataset(self, identifier, dataset_id):
-        self.change_level_i14y(dataset_id, "Internal")
-        print(f"Changed publication level to Internal for {identifier}")
-
         try:
+            if not self.journal.done("level", dataset_id, level="Internal"):
+                self.change_level_i14y(dataset_id, "Internal")
+                self.journal.record("level", dataset_id, level="Internal")
+            print(f"Changed publication level to Internal for {identifier}")
+
             response = self.delete_i14y(dataset_id)
             print(f"Successfully deleted dataset: {identifier}")
         except requests.HTTPError as e:
             code = e.response.status_code if e.response is not None else "?"
             txt = e.response.text if e.response is not None else str(e)
-            print(f"Failed to delete dataset {identifier}: {code} - {txt}")
-            raise
+            if code != 404:
+                print(f"Failed to delete dataset {identifier}: {code} - {txt}")
+                raise
+            # Deleted since it was listed (e.g. by an interrupted run applying the same plan)
+            print(f"Dataset already deleted: {identifier}")
+        self.journal.record("delete", identifier, dataset_id=dataset_id)
 
         return {"status": "deleted", "identifier": identifier, "dataset_id": dataset_id}
 
-    def harvest(self):
+    def plan(self, skip_unmodified_export: bool = False) -> Optional[Dict]:
+        """
+        Fetches the DCAT export and the i14y listing and computes what the harvest would do, without writing to i14y:
+        creates, updates with their reasons, deletes, structure jobs and an estimate of the requests.
+        Returns None if skip_unmodified_export is set and the export was already harvested completely.
+        """
+        self.fingerprints = self.load_data(self.fingerprints_file_path)
+
+        print("Fetching datasets from API...")
+        try:
+            with METRICS.stage("download"):
+                export = self.open_dcat_export()
+        except requests.exceptions.RequestException as e:
+            print(f"Network error during request: {e}")
+            export = None
+
+        if (
+            skip_unmodified_export
+            and export is not None
+            and self.export_not_modified
+            and self.last_run_completed()
+            and not UPDATE_ALL
+        ):
+            export.close()
+            return None
+
+        datasets = self.fetch_datasets_from_api(export) if export is not None else []
+        snapshot = CatalogSnapshot(self.get_all_existing_datasets(self.organization))
+
+        with METRICS.stage("plan"):
+            return self.build_plan(datasets, snapshot)
+
+    def build_plan(self, datasets: List[Dict], snapshot: CatalogSnapshot) -> Dict:
+        """
+        Plan of the harvest of the datasets extracted from the export, against the i14y datasets listed.
+        The structure jobs are informational: applying the plan imports the structures of the datasets actually
+        created or updated (the i14y id of a dataset to create is only known once it is created)
+        """
         utc_plus_1 = datetime.timezone(datetime.timedelta(hours=1))
         now_utc_plus_1 = datetime.datetime.now(utc_plus_1)
         yesterday = now_utc_plus_1 - datetime.timedelta(days=1)
 
-        dataset_status_identifier_id_map = {"created": {}, "updated": {}, "unchanged": {}, "deleted": {}}
+        all_existing_map = snapshot.identifier_id_map()
+        entries = [self.plan_dataset(dataset, all_existing_map, yesterday) for dataset in datasets]
+
+        current_source_identifiers = {entry["identifier"] for entry in entries}
+        deletes = [
+            {"identifier": identifier, "dataset_id": all_existing_map[identifier]}
+            for identifier in sorted(set(all_existing_map.keys()) - current_source_identifiers)
+        ]
+        # The structure importer processes the datasets created or updated (dataset_id None for the creates)
+        structure_jobs = [
+            {"identifier": entry["identifier"], "dataset_id": entry["dataset_id"]}
+            for entry in entries
+            if entry["action"] != "unchanged"
+        ]
+        export_meta = self.load_data(self.export_cache_meta_path) if os.path.exists(self.export_cache_meta_path) else {}
+
+        plan = {
+            "created_at": now_utc_plus_1.isoformat(timespec="seconds"),
+            "api_base_url": self.api_base_url,
+            "organization": self.organization,
+            "export": {"etag": export_meta.get("etag"), "last_modified": export_meta.get("last_modified")},
+            # Payload code the datasets were extracted with
+            "payload_version": self.payload_version,
+            # State the plan was computed from, a plan is out of date once another run completed
+            "fingerprints": payload_fingerprint(self.fingerprints),
+            "existing": [
+                {"id": dataset["id"], "identifiers": dataset["identifiers"]} for dataset in snapshot.datasets.values()
+            ],
+            "datasets": entries,
+            "deletes": deletes,
+            "structure_jobs": structure_jobs,
+            # The metadata index of the structure import pages through the whole data.bl.ch catalog
+            "ods_catalog_total": self.ods_catalog_total,
+        }
+        plan["estimated_requests"] = self.estimate_requests(plan)
+        return plan
 
-        print("Fetching datasets from API...")
-        datasets = self.fetch_datasets_from_api()
+    @staticmethod
+    def estimate_requests(plan: Dict) -> Dict[str, int]:
+        """
+        Estimate of the requests the plan sends to i14y and data.bl.ch, per endpoint family. The structure
+        requests are an upper bound: structures unchanged since their last upload are not sent again
+        """
+        creates = sum(1 for entry in plan["datasets"] if entry["action"] == "create")
+        updates = sum(1 for entry in plan["datasets"] if entry["action"] == "update")
+        deletes = len(plan["deletes"])
+        structures = len(plan["structure_jobs"])
+        if structures >= ODS_BULK_METADATA_MIN_DATASETS:
+            # Without the tag index, the number of datasets of the export is the closest count of the catalog
+            ods_catalog_total = plan["ods_catalog_total"] or len(plan["datasets"])
+            metadata = max(1, -(-ods_catalog_total // ODS_PAGE_SIZE))
+        else:
+            metadata = structures
+
+        estimate = {
+            # POST or PUT, DELETE
+            "datasets": creates + updates + deletes,
+            # Public level and Recorded status of the creates, Internal level of the deletes
+            "publication-level": 2 * creates + deletes,
+            # Delete and import per structure job, delete with the dataset
+            "structures": 2 * structures + deletes,
+            "metadata": metadata,
+        }
+        estimate["total"] = sum(estimate.values())
+        return estimate
+
+    @staticmethod
+    def print_plan(plan: Dict):
+        print("\n=== Plan ===")
+        print(f"Computed at {plan['created_at']} for {plan['api_base_url']}")
+        for action in ["create", "update", "unchanged"]:
+            entries = [entry for entry in plan["datasets"] if entry["action"] == action]
+            print(f"{action.capitalize()}: {len(entries)}")
+            if action != "unchanged":
+                for entry in entries:
+                    dataset_id = f" : {entry['dataset_id']}" if entry["dataset_id"] else ""
+                    print(f"- {entry['identifier']}{dataset_id} ({entry['reason']})")
+        print(f"Delete: {len(plan['deletes'])}")
+        for delete in plan["deletes"]:
+            print(f"- {delete['identifier']} : {delete['dataset_id']}")
+        print(f"Structure jobs (informational, follow the creates and updates applied): {len(plan['structure_jobs'])}")
+        print(
+            "Estimated requests: "
+            + ", ".join(f"{family} {count}" for family, count in plan["estimated_requests"].items())
+            + " (structures: at most)"
+        )
+
+    def harvest(
+        self,
+        on_dataset_written: Optional[Callable[[str, str], None]] = None,
+        resume: bool = False,
+        plan: Optional[Dict] = None,
+    ):
+        """
+        on_dataset_written(identifier, dataset_id) is called for each dataset created or updated, as soon as it is
+        submitted (used to import the structures while the harvest runs, see PIPELINE_STRUCTURE_IMPORT)
+        resume: skips the operations journaled by the previous run, if it did not complete
+        plan: executes this plan (written by --plan) instead of planning from the current export and listing
+        """
+        if plan is not None and not resume and self.journal.load():
+            # The datasets created by the interrupted run are not in the listing of the plan: they would be created again
+            raise Exception(
+                f"An interrupted run left {self.journal.path}: apply the plan with --resume, or run --plan again"
+            )
+        self.journal.open(resume)
+        self.resuming = resume
+
+        if plan is None:
+            plan = self.plan(skip_unmodified_export=True)
+            if plan is None:
+                log = (
+                    f"Harvest skipped at {datetime.datetime.now()}: "
+                    "DCAT export and payload code not modified since last complete run\n"
+                )
+                log_path = os.path.join(os.getcwd(), "harvest_log.txt")
+                with open(log_path, "w") as f:
+                    f.write(log)
+                print(log)
+                statuses = {"created": {}, "updated": {}, "unchanged": {}, "deleted": {}}
+                if resume:
+                    # The harvest completed, only what followed it failed: keep its results for the structure import
+                    previous = self.load_data(self.datasets_file_path)
+                    statuses = {action: previous.get(action, {}) for action in statuses}
+                    for action in ["created", "updated"]:
+                        for identifier, dataset_id in statuses[action].items():
+                            if on_dataset_written is not None:
+                                on_dataset_written(identifier, dataset_id)
+                # Always written: OGD_BL/data is not kept between CI runs, only OGD_BL/state
+                self.save_data(statuses, self.datasets_file_path)
+                self.journal.clear()
+                METRICS.write()
+                return
+        else:
+            self.fingerprints = self.load_data(self.fingerprints_file_path)
+
+        self.apply_plan(plan, on_dataset_written)
+
+    def apply_plan(self, plan: Dict, on_dataset_written: Optional[Callable[[str, str], None]] = None):
+        """Submits, publishes and deletes the datasets as planned, then writes the log and the state"""
+        if plan["api_base_url"] != self.api_base_url or plan["organization"] != self.organization:
+            raise Exception(
+                f"The plan was computed for {plan['api_base_url']} ({plan['organization']}), "
+                f"not for {self.api_base_url} ({self.organization})"
+            )
+        if plan["fingerprints"] != payload_fingerprint(self.fingerprints):
+            raise Exception("The plan is out of date: a harvest completed since it was computed, run --plan again")
+
+        dataset_status_identifier_id_map = {"created": {}, "updated": {}, "unchanged": {}, "deleted": {}}
         print("\nStarting dataset import...\n")
 
-        current_source_identifiers = {dataset["identifiers"][0] for dataset in datasets}
-        all_existing_datasets = self.get_all_existing_datasets(self.organization)
-        all_existing_datasets_identifier_id_map = self.get_all_identifier_id_map(all_existing_datasets)
+        current_source_identifiers = {entry["identifier"] for entry in plan["datasets"]}
+        self.catalog_snapshot = CatalogSnapshot(plan["existing"])
+        all_existing_datasets_identifier_id_map = self.catalog_snapshot.identifier_id_map()
 
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             futures = [
-                executor.submit(
-                    self._process_one_dataset,
-                    dataset,
-                    all_existing_datasets_identifier_id_map,
-                    yesterday,
-                )
-                for dataset in datasets
+                executor.submit(self.apply_dataset, entry, all_existing_datasets_identifier_id_map)
+                for entry in plan["datasets"]
             ]
 
             for future in as_completed(futures):
@@ -311,18 +782,24 @@ class HarvesterBL(CommonI14YAPI):
 
                 if status in dataset_status_identifier_id_map and dataset_id:
                     dataset_status_identifier_id_map[status][identifier] = dataset_id
-
-        datasets_to_delete = set(all_existing_datasets_identifier_id_map.keys()) - current_source_identifiers
+                if status == "created" and dataset_id:
+                    self.catalog_snapshot.add(identifier, dataset_id)
+                if status in ("created", "updated") and dataset_id and on_dataset_written is not None:
+                    on_dataset_written(identifier, dataset_id)
+
+        # Deleted by the interrupted run (still in the listing of a plan computed before it)
+        for identifier, entry in self.journal.completed("delete").items():
+            if identifier not in current_source_identifiers:
+                dataset_status_identifier_id_map["deleted"][identifier] = entry["dataset_id"]
+                self.fingerprints.pop(identifier, None)
+                self.catalog_snapshot.remove(entry["dataset_id"])
 
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             delete_futures = [
-                executor.submit(
-                    self._delete_one_dataset,
-                    identifier,
-                    all_existing_datasets_identifier_id_map[identifier],
-                )
-                for identifier in datasets_to_delete
-                if identifier in all_existing_datasets_identifier_id_map.keys()
+                executor.submit(self._delete_one_dataset, delete["identifier"], delete["dataset_id"])
+                for delete in plan["deletes"]
+                # Deleted by the interrupted run, reported above
+                if not self.journal.done("delete", delete["identifier"])
             ]
 
             for future in as_completed(delete_futures):
@@ -330,28 +807,57 @@ class HarvesterBL(CommonI14YAPI):
                 identifier = result["identifier"]
                 dataset_id = result["dataset_id"]
                 dataset_status_identifier_id_map["deleted"][identifier] = dataset_id
+                self.fingerprints.pop(identifier, None)
+                self.catalog_snapshot.remove(dataset_id)
 
         log = f"Harvest completed successfully at {datetime.datetime.now()}\n"
         for action in ["created", "updated", "unchanged", "deleted"]:
             log += f"\n{action.capitalize()} datasets: {len(dataset_status_identifier_id_map[action])}"
             for bfs_identifier, i14y_id in dataset_status_identifier_id_map[action].items():
                 log += f"\n- {bfs_identifier} : {i14y_id}"
+        log += f"\n\n{write_concurrency_report()}"
+        log += f"\n{RETRY_POLICY.report()}"
+        log += f"\n{METRICS.report()}"
 
         log_path = os.path.join(os.getcwd(), "harvest_log.txt")
         with open(log_path, "w") as f:
             f.write(log)
 
         print("\n=== Import Summary ===")
-        print(f"Total processed: {len(datasets)}")
+        print(f"Total processed: {len(plan['datasets'])}")
         for action in ["created", "updated", "unchanged", "deleted"]:
             print(f"Total {action.capitalize()}: {len(dataset_status_identifier_id_map[action])}")
+        print(write_concurrency_report())
+        print(RETRY_POLICY.report())
+        print(METRICS.report())
 
         print(f"Log saved to: {log_path}")
+        METRICS.write()
 
         self.save_data(dataset_status_identifier_id_map, self.datasets_file_path)
+        self.save_data(self.fingerprints, self.fingerprints_file_path)
+        # An older plan file may not match the cached export any more
+        export_meta = self.load_data(self.export_cache_meta_path) if os.path.exists(self.export_cache_meta_path) else {}
+        if plan["export"] == {"etag": export_meta.get("etag"), "last_modified": export_meta.get("last_modified")}:
+            self.mark_export_completed(plan.get("payload_version"))
+        self.journal.clear()
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Harvests the data.bl.ch catalog to i14y")
+    arg_parser.add_argument(
+        "--resume", action="store_true", help="skip the operations completed by the previous run, if it failed"
+    )
+    arg_parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="plan.json",
+        metavar="PLAN_FILE",
+        help="only compute what the run would do (nothing is written to i14y), print it and save it to PLAN_FILE",
+    )
+    arg_parser.add_argument("--apply", metavar="PLAN_FILE", help="execute a plan saved by --plan without planning again")
+    args = arg_parser.parse_args()
+
     # We use the same file for ABN and PROD, therefore we can use env vars passed by github actions to distinguish one from another
     api_params = {
         "client_key": os.environ["CLIENT_KEY"],
@@ -363,8 +869,30 @@ if __name__ == "__main__":
     }
 
     harvester = HarvesterBL(api_params)
-    harvester.harvest()
-
     import_structures = os.environ.get("IMPORT_STRUCTURES", "false") == "true"
-    if import_structures:
-        StructureImporter.execute(api_params)
+
+    if args.plan:
+        plan = harvester.plan()
+        harvester.print_plan(plan)
+        harvester.save_data(plan, os.path.abspath(args.plan))
+        print(f"Plan saved to: {args.plan}")
+        raise SystemExit(0)
+
+    plan = harvester.load_data(args.apply) if args.apply else None
+    if args.apply and not plan:
+        raise Exception(f"Could not read the plan {args.apply}")
+
+    if import_structures and PIPELINE_STRUCTURE_IMPORT:
+        importer = StructureImporter(api_params)
+        importer.start_pipeline(resume=args.resume)
+        try:
+            harvester.harvest(on_dataset_written=importer.submit_structure, resume=args.resume, plan=plan)
+        except BaseException:
+            # The harvest error is the one reported: the structures still queued are dropped, not imported
+            importer.cancel_pipeline()
+            raise
+        importer.finish_pipeline(snapshot=harvester.catalog_snapshot)
+    else:
+        harvester.harvest(resume=args.resume, plan=plan)
+        if import_structures:
+            StructureImporter.execute(api_params, snapshot=harvester.catalog_snapshot, resume=args.resume)
@@ -0,0 +1,432 @@
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from catalog_generator import write_catalog
+
+# Local stand-in for the i14y partner API (under /i14y) and the data.bl.ch endpoints (at the root) used by the
+# harvester and the structure importer, with injected latency, errors and index write lock contention
+
+FAMILIES = ["token", "list", "datasets", "publication-level", "structures", "ods"]
+
+LOCK_ERROR = (
+    "org.apache.lucene.store.LockObtainFailedException: Lock held by this virtual machine: /data/index/write.lock"
+)
+
+ODS_FIELD_TYPES = ["text", "int", "double", "date", "datetime", "boolean", "geo_point_2d", "geo_shape", "url"]
+
+
+class StubSettings:
+    """Per endpoint family latency (seconds) and error rate, and the simulated index write lock"""
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, float]] = None,
+        error_rate: Optional[Dict[str, float]] = None,
+        write_lock: bool = True,
+        lock_wait: float = 0.05,
+        seed: int = 1,
+    ):
+        self.latency = latency or {}
+        self.error_rate = error_rate or {}
+        # Writes hold a single global lock while they are "indexed" (their latency), like the index of iop-core.
+        # A write waiting longer than lock_wait for it fails with a LockObtainFailedException
+        self.write_lock = write_lock
+        self.lock_wait = lock_wait
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+
+class StubState:
+    """Datasets of the fake i14y organization and of the fake data.bl.ch catalog"""
+
+    def __init__(self, catalog_datasets: int, stale_datasets: int = 0, seed: int = 1, first_number: int = 10000):
+        catalog = io.StringIO()
+        write_catalog(catalog, catalog_datasets, seed=seed, first_number=first_number)
+        self.catalog = catalog.getvalue().encode("utf-8")
+        self.catalog_etag = f'"{uuid.uuid4()}"'
+        self.ods_numbers = list(range(first_number, first_number + catalog_datasets))
+
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.datasets: Dict[str, Dict] = {}
+        # Datasets of the organization that are no longer in the catalog (deleted by the harvest)
+        for number in range(first_number + catalog_datasets, first_number + catalog_datasets + stale_datasets):
+            dataset_id = str(uuid.uuid4())
+            self.datasets[dataset_id] = {
+                "id": dataset_id,
+                "identifiers": [f"CH_KT_BL_dataset_{number}"],
+                "publicationLevel": "Public",
+                "registrationStatus": "Recorded",
+                "structure": False,
+            }
+
+
+class StubStatistics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.statuses = Counter()
+        self.injected_errors = Counter()
+        self.lock_failures = 0
+        self.writes_in_flight = 0
+        self.max_writes_in_flight = 0
+
+    def record(self, family: str, status: int):
+        with self.lock:
+            self.requests[family] += 1
+            self.statuses[f"{family} {status}"] += 1
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "statuses": dict(self.statuses),
+                "injected_errors": dict(self.injected_errors),
+                "lock_failures": self.lock_failures,
+                "max_writes_in_flight": self.max_writes_in_flight,
+            }
+
+
+def family_of(method: str, path: str) -> str:
+    """Endpoint family of a request, as the harvester classifies its writes"""
+    if path == "/token":
+        return "token"
+    if not path.startswith("/i14y/"):
+        return "ods"
+    if "/structures" in path:
+        return "structures"
+    if path.endswith("/publication-level") or path.endswith("/registration-status"):
+        return "publication-level"
+    if method == "GET":
+        return "list"
+    return "datasets"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "I14YStubServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method: str):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        family = family_of(method, url.path)
+        settings = self.server.settings
+        statistics = self.server.statistics
+
+        if url.path == "/stats":
+            return self.send(200, statistics.to_dict())
+
+        is_write = method != "GET" and family not in ("token", "ods")
+        if family not in ("token", "ods") and self.headers.get("Authorization", "")[7:] not in self.server.state.tokens:
+            return self.respond(family, 401, {"detail": "Invalid token"})
+
+        with settings.random_lock:
+            injected = settings.random.random() < settings.error_rate.get(family, 0.0)
+        if injected:
+            with statistics.lock:
+                statistics.injected_errors[family] += 1
+            time.sleep(settings.latency.get(family, 0.0))
+            return self.respond(family, 503, {"detail": "Service Unavailable (injected)"})
+
+        if not (is_write and settings.write_lock):
+            time.sleep(settings.latency.get(family, 0.0))
+            return self.dispatch(method, url.path, params, body, family)
+
+        with statistics.lock:
+            statistics.writes_in_flight += 1
+            statistics.max_writes_in_flight = max(statistics.max_writes_in_flight, statistics.writes_in_flight)
+        try:
+            if not self.server.write_lock.acquire(timeout=settings.lock_wait):
+                with statistics.lock:
+                    statistics.lock_failures += 1
+                return self.respond(family, 500, {"title": "Internal Server Error", "detail": LOCK_ERROR})
+            try:
+                time.sleep(settings.latency.get(family, 0.0))
+                return self.dispatch(method, url.path, params, body, family)
+            finally:
+                self.server.write_lock.release()
+        finally:
+            with statistics.lock:
+                statistics.writes_in_flight -= 1
+
+    def dispatch(self, method: str, path: str, params: Dict[str, str], body: bytes, family: str):
+        state = self.server.state
+        parts = [part for part in path.split("/") if part]
+
+        if path == "/token" and method == "POST":
+            token = str(uuid.uuid4())
+            with state.lock:
+                state.tokens.add(token)
+            return self.respond(family, 200, {"access_token": token, "expires_in": 300, "token_type": "Bearer"})
+
+        if family == "ods":
+            return self.dispatch_ods(path, params, family)
+
+        # /i14y/datasets[/<id>[/<action>[/imports]]]
+        if parts[:2] != ["i14y", "datasets"]:
+            return self.respond(family, 404, {"detail": "Not found"})
+        dataset_id = parts[2] if len(parts) > 2 else None
+        action = "/".join(parts[3:])
+
+        with state.lock:
+            if dataset_id is None and method == "GET":
+                return self.list_datasets(params, family)
+            if dataset_id is None and method == "POST":
+                payload = json.loads(body or b"{}").get("data", {})
+                dataset_id = str(uuid.uuid4())
+                state.datasets[dataset_id] = {
+                    "id": dataset_id,
+                    "identifiers": payload.get("identifiers", []),
+                    "publicationLevel": "Internal",
+                    "registrationStatus": "Incomplete",
+                    "structure": False,
+                }
+                return self.respond(family, 201, dataset_id)
+
+            dataset = state.datasets.get(dataset_id)
+            if dataset is None:
+                return self.respond(family, 404, {"detail": f"Dataset {dataset_id} not found"})
+
+            if action == "" and method == "PUT":
+                payload = json.loads(body or b"{}").get("data", {})
+                dataset["identifiers"] = payload.get("identifiers", dataset["identifiers"])
+                return self.respond(family, 204, None)
+            if action == "" and method == "DELETE":
+                del state.datasets[dataset_id]
+                return self.respond(family, 204, None)
+            if action == "publication-level" and method == "PUT":
+                if dataset["publicationLevel"] == params.get("level"):
+                    detail = f"The resource already has its publication level set to {params.get('level')}"
+                    return self.respond(family, 400, {"detail": detail})
+                dataset["publicationLevel"] = params.get("level")
+                return self.respond(family, 204, None)
+            if action == "registration-status" and method == "PUT":
+                dataset["registrationStatus"] = params.get("status")
+                return self.respond(family, 204, None)
+            if action == "structures" and method == "DELETE":
+                # Like i14y, deleting the structure of a dataset without one succeeds
+                dataset["structure"] = False
+                return self.respond(family, 204, None)
+            if action == "structures/imports" and method == "POST":
+                dataset["structure"] = True
+                return self.respond(family, 201, str(uuid.uuid4()))
+
+        return self.respond(family, 404, {"detail": "Not found"})
+
+    def list_datasets(self, params: Dict[str, str], family: str):
+        datasets = list(self.server.state.datasets.values())
+        if "datasetIdentifier" in params:
+            datasets = [dataset for dataset in datasets if params["datasetIdentifier"] in dataset["identifiers"]]
+        page_size = int(params.get("pageSize", 100))
+        page = int(params.get("page", 1))
+        page_datasets = datasets[(page - 1) * page_size : page * page_size]
+        return self.respond(
+            family, 200, {"data": [{"id": dataset["id"], "identifiers": dataset["identifiers"]} for dataset in page_datasets]}
+        )
+
+    def dispatch_ods(self, path: str, params: Dict[str, str], family: str):
+        state = self.server.state
+        if path == "/api/explore/v2.1/catalog/exports/dcat":
+            if self.headers.get("If-None-Match") == state.catalog_etag:
+                return self.respond(family, 304, None)
+            return self.respond(family, 200, state.catalog, "application/rdf+xml", {"ETag": state.catalog_etag})
+
+        if path == "/api/datasets/1.0/search/":
+            start = int(params.get("start", 0))
+            rows = int(params.get("rows", 10))
+            numbers = state.ods_numbers[start : start + rows]
+            return self.respond(
+                family,
+                200,
+                {
+                    "nhits": len(state.ods_numbers),
+                    "datasets": [{"datasetid": str(number), "metas": {"tags": ["opendata.swiss"]}} for number in numbers],
+                },
+            )
+
+        if path.rstrip("/") == "/api/explore/v2.1/catalog/datasets":
+            # Like data.bl.ch, at most 100 datasets per page
+            offset = int(params.get("offset", 0))
+            limit = min(int(params.get("limit", 10)), 100)
+            numbers = state.ods_numbers[offset : offset + limit]
+            return self.respond(
+                family,
+                200,
+                {"total_count": len(state.ods_numbers), "results": [ods_dataset_metadata(number) for number in numbers]},
+            )
+
+        prefix = "/api/explore/v2.1/catalog/datasets/"
+        if path.startswith(prefix):
+            number = path[len(prefix) :].strip("/")
+            if not number.isdigit() or int(number) not in state.ods_numbers:
+                return self.respond(family, 404, {"error_code": "DatasetNotFound"})
+            return self.respond(family, 200, ods_dataset_metadata(int(number)))
+
+        prefix = "/api/datasets/1.0/"
+        if path.startswith(prefix):
+            return self.respond(family, 200, {"datasetid": path[len(prefix) :].strip("/"), "metas": {"tags": ["opendata.swiss"]}})
+
+        return self.respond(family, 404, {"error_code": "NotFound"})
+
+    def respond(self, family: str, status: int, body, content_type: str = "application/json", headers: Dict = None):
+        self.server.statistics.record(family, status)
+        return self.send(status, body, content_type, headers)
+
+    def send(self, status: int, body, content_type: str = "application/json", headers: Dict = None):
+        if body is None:
+            data = b""
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+
+def ods_dataset_metadata(number: int) -> Dict:
+    """Metadata of a data.bl.ch dataset (explore v2.1), with a few fields of every type"""
+    fields = []
+    for position in range(3 + number % 10):
+        ods_type = ODS_FIELD_TYPES[(number + position) % len(ODS_FIELD_TYPES)]
+        fields.append(
+            {
+                "name": f"feld_{position}",
+                "label": f"<b>Feld</b> {position} &amp; Wert",
+                "type": ods_type,
+                "description": "conformsTo:https://www.geo.bl.ch/modell" if position == 1 else None,
+            }
+        )
+    return {
+        "dataset_id": str(number),
+        "metas": {
+            "default": {
+                "title": f"Datensatz {number}",
+                "description": f"<p>Beschreibung des Datensatzes {number}</p>",
+                "language": "de",
+            }
+        },
+        "fields": fields,
+    }
+
+
+class I14YStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], state: StubState, settings: StubSettings):
+        super().__init__(address, StubHandler)
+        self.state = state
+        self.settings = settings
+        self.statistics = StubStatistics()
+        self.write_lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self) -> Dict[str, str]:
+        """Environment variables pointing the harvester and the structure importer to this server"""
+        return {
+            "API_BASE_URL": f"{self.base_url}/i14y",
+            "GET_TOKEN_URL": f"{self.base_url}/token",
+            "BL_BASE_URL": self.base_url,
+            "CLIENT_KEY": "stub",
+            "CLIENT_SECRET": "stub",
+        }
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def parse_family_values(values: List[str]) -> Dict[str, float]:
+    """Parses family=value pairs, e.g. datasets=0.05 (all=value applies to every family)"""
+    result = {}
+    for item in values or []:
+        family, _, value = item.partition("=")
+        if family == "all":
+            result.update({name: float(value) for name in FAMILIES})
+        elif family in FAMILIES:
+            result[family] = float(value)
+        else:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint family {family}, expected one of {', '.join(FAMILIES)}")
+    return result
+
+
+def add_stub_arguments(arg_parser: argparse.ArgumentParser):
+    families = ", ".join(FAMILIES)
+    arg_parser.add_argument("--datasets", type=int, default=1000, help="datasets of the data.bl.ch catalog")
+    arg_parser.add_argument("--stale", type=int, default=0, help="i14y datasets missing from the catalog (deleted)")
+    arg_parser.add_argument("--latency", nargs="*", default=[], help=f"family=seconds, families: all, {families}")
+    arg_parser.add_argument("--error-rate", nargs="*", default=[], help="family=rate of injected 503 responses")
+    arg_parser.add_argument("--lock-wait", type=float, default=0.05, help="seconds a write waits for the index lock")
+    arg_parser.add_argument("--no-write-lock", action="store_true", help="let writes run concurrently")
+    arg_parser.add_argument("--seed", type=int, default=1)
+
+
+def create_server(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> I14YStubServer:
+    settings = StubSettings(
+        latency=parse_family_values(args.latency),
+        error_rate=parse_family_values(args.error_rate),
+        write_lock=not args.no_write_lock,
+        lock_wait=args.lock_wait,
+        seed=args.seed,
+    )
+    state = StubState(args.datasets, args.stale, seed=args.seed)
+    return I14YStubServer((host, port), state, settings)
+
+
+def main(argv: List[str] = None):
+    arg_parser = argparse.ArgumentParser(description="Local stand-in for the i14y partner API and data.bl.ch")
+    add_stub_arguments(arg_parser)
+    arg_parser.add_argument("--port", type=int, default=8080)
+    args = arg_parser.parse_args(argv)
+
+    server = create_server(args, port=args.port)
+    print(f"Serving on {server.base_url}, statistics on {server.base_url}/stats")
+    for name, value in server.environment().items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
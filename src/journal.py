@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class RunJournal:
+    """
+    Append-only journal (JSON lines) of the i14y operations completed by a run: submit, level, status, delete,
+    structure upload, with the returned i14y ids. Each line is flushed to disk before the operation counts as done,
+    so that a run that crashed or timed out can be resumed (--resume) without redoing the operations journaled.
+    The journal is cleared when the run completes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # (operation, key) -> last entry
+        self.entries: Dict[Tuple[str, str], Dict] = {}
+
+    def open(self, resume: bool = False):
+        """Replays the journal of the previous run if resume is set, otherwise starts a new one"""
+        self.entries = {}
+        if resume:
+            self.entries = self.load()
+            print(f"Resuming from {len(self.entries)} operations journaled in {self.path}")
+        else:
+            self.clear()
+
+    def load(self) -> Dict[Tuple[str, str], Dict]:
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line cut by the crash
+                    continue
+                entries[(entry["op"], entry["key"])] = entry
+        return entries
+
+    def record(self, operation: str, key: str, **fields):
+        """Appends a completed operation (key: identifier or i14y id) and syncs it to disk"""
+        entry = {"op": operation, "key": key, **fields, "at": round(time.time(), 3)}
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+            self.entries[(operation, key)] = entry
+
+    def get(self, operation: str, key: str) -> Optional[Dict]:
+        with self.lock:
+            return self.entries.get((operation, key))
+
+    def done(self, operation: str, key: str, **fields) -> bool:
+        """Checks if the operation was journaled with these field values"""
+        entry = self.get(operation, key)
+        return entry is not None and all(entry.get(name) == value for name, value in fields.items())
+
+    def completed(self, operation: str) -> Dict[str, Dict]:
+        """key -> entry of an operation"""
+        with self.lock:
+            return {key: entry for (op, key), entry in self.entries.items() if op == operation}
+
+    def clear(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.entries = {}
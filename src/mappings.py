@@ -176,3 +176,27 @@ LANGUAGES_MAPPING = {
 }
 
 VALID_LICENSE_CODES = {"terms_open", "terms_by", "terms_by_ask", "terms_ask"}
+
+
+# Reverse indexes built once at import, used by the extractors instead of scanning the maps above
+
+# Language URI or code -> i14y language codes
+LANGUAGE_CODES_BY_URI = {}
+for _code, _uris in LANGUAGES_MAPPING.items():
+    for _uri in _uris:
+        LANGUAGE_CODES_BY_URI.setdefault(_uri, []).append(_code)
+
+# Availability URI -> i14y availability code (first match in VOCAB_EU_PLANNED_AVAILABILITY)
+AVAILABILITY_CODE_BY_URI = {}
+for _code, _uris in VOCAB_EU_PLANNED_AVAILABILITY.items():
+    for _uri in _uris:
+        AVAILABILITY_CODE_BY_URI.setdefault(_uri, _code)
+
+# i14y media type codes
+MEDIA_TYPE_CODES = set(MEDIA_TYPE_MAPPING.values())
+
+# Theme label -> i14y theme codes in THEME_MAPPING order. The labels of THEME_MAPPING are matched as substrings
+# (see get_themes), labels that are not in this index are resolved once by the extractor and cached
+THEME_CODES_BY_LABEL = {
+    _label: [code for code, labels in THEME_MAPPING.items() if _label in labels] for _label in THEME_MAPPING.values()
+}
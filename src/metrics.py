@@ -0,0 +1,223 @@
+import contextlib
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import METRICS_JSON_FILE, METRICS_PROMETHEUS_FILE, REQUEST_DURATION_BUCKETS
+
+
+class Histogram:
+    """Cumulative latency histogram (Prometheus buckets)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = REQUEST_DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        for position, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[position] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class RunMetrics:
+    """
+    Metrics of a run, shared by the harvester and the structure importer of the process:
+    - stages: time spent and number of calls per stage (download, parse, extract, submit...). Stages running in
+      worker threads are summed over the threads, so their time can exceed the wall time of the run
+    - requests: latency histogram, status codes and bytes sent and received per endpoint (see endpoint_label)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.stage_seconds = Counter()
+        self.stage_calls = Counter()
+        self.latencies: Dict[str, Histogram] = {}
+        self.statuses = Counter()
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+
+    def record_stage(self, name: str, seconds: float):
+        with self.lock:
+            self.stage_seconds[name] += seconds
+            self.stage_calls[name] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Records the time spent in the with block under a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start)
+
+    def timed(self, name: str) -> Callable:
+        """Decorator recording every call of the function under a stage"""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrap_func(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+
+            return wrap_func
+
+        return decorator
+
+    def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Yields the items of an iterable, recording the time spent producing them (e.g. a streaming parser)"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def record_request(self, endpoint: str, status: str, seconds: float, sent: int = 0, received: int = 0):
+        with self.lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = Histogram()
+            self.latencies[endpoint].observe(seconds)
+            self.statuses[(endpoint, status)] += 1
+            self.bytes_sent[endpoint] += sent
+            self.bytes_received[endpoint] += received
+
+    def record_bytes(self, endpoint: str, received: int):
+        """Counts bytes of a streamed response, read after the request has been recorded"""
+        with self.lock:
+            self.bytes_received[endpoint] += received
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            endpoints = sorted(set(self.latencies) | set(self.bytes_received))
+            return {
+                "started_at": self.started_at,
+                "run_seconds": round(time.time() - self.started_at, 3),
+                "stages": {
+                    name: {"seconds": round(self.stage_seconds[name], 4), "calls": self.stage_calls[name]}
+                    for name in sorted(self.stage_seconds)
+                },
+                "requests": {
+                    endpoint: {
+                        "latency": self.latencies[endpoint].to_dict() if endpoint in self.latencies else None,
+                        "statuses": {
+                            status: count for (name, status), count in sorted(self.statuses.items()) if name == endpoint
+                        },
+                        "bytes_sent": self.bytes_sent[endpoint],
+                        "bytes_received": self.bytes_received[endpoint],
+                    }
+                    for endpoint in endpoints
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format, for the node exporter textfile collector"""
+        data = self.to_dict()
+        lines = [
+            "# HELP harvester_run_start_timestamp_seconds Start of the run",
+            "# TYPE harvester_run_start_timestamp_seconds gauge",
+            f"harvester_run_start_timestamp_seconds {data['started_at']:.3f}",
+            "# HELP harvester_run_duration_seconds Wall time of the run",
+            "# TYPE harvester_run_duration_seconds gauge",
+            f"harvester_run_duration_seconds {data['run_seconds']}",
+            "# HELP harvester_stage_seconds_total Time spent per stage, summed over worker threads",
+            "# TYPE harvester_stage_seconds_total counter",
+        ]
+        for name, stage in data["stages"].items():
+            lines.append(f"harvester_stage_seconds_total{{stage={label(name)}}} {stage['seconds']}")
+        lines += ["# HELP harvester_stage_calls_total Calls per stage", "# TYPE harvester_stage_calls_total counter"]
+        for name, stage in data["stages"].items():
+            lines.append(f"harvester_stage_calls_total{{stage={label(name)}}} {stage['calls']}")
+
+        lines += [
+            "# HELP harvester_request_duration_seconds Latency of the HTTP requests per endpoint",
+            "# TYPE harvester_request_duration_seconds histogram",
+        ]
+        for endpoint, request in data["requests"].items():
+            latency = request["latency"]
+            if latency is None:
+                continue
+            for bound, count in latency["buckets"].items():
+                lines.append(
+                    f"harvester_request_duration_seconds_bucket{{endpoint={label(endpoint)},le=\"{bound}\"}} {count}"
+                )
+            lines.append(
+                f"harvester_request_duration_seconds_bucket{{endpoint={label(endpoint)},le=\"+Inf\"}} {latency['count']}"
+            )
+            lines.append(f"harvester_request_duration_seconds_sum{{endpoint={label(endpoint)}}} {latency['sum']}")
+            lines.append(f"harvester_request_duration_seconds_count{{endpoint={label(endpoint)}}} {latency['count']}")
+
+        lines += [
+            "# HELP harvester_requests_total HTTP requests per endpoint and status code (error: no response)",
+            "# TYPE harvester_requests_total counter",
+        ]
+        for endpoint, request in data["requests"].items():
+            for status, count in request["statuses"].items():
+                lines.append(f"harvester_requests_total{{endpoint={label(endpoint)},status={label(status)}}} {count}")
+
+        lines += [
+            "# HELP harvester_transferred_bytes_total Bytes sent and received per endpoint",
+            "# TYPE harvester_transferred_bytes_total counter",
+        ]
+        for endpoint, request in data["requests"].items():
+            for direction in ("sent", "received"):
+                lines.append(
+                    f"harvester_transferred_bytes_total{{endpoint={label(endpoint)},direction=\"{direction}\"}} "
+                    f"{request[f'bytes_{direction}']}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: Optional[str] = None):
+        """Writes the metrics as JSON and as a Prometheus textfile (next to the run logs by default)"""
+        directory = directory or os.getcwd()
+        with open(os.path.join(directory, METRICS_JSON_FILE), "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        with open(os.path.join(directory, METRICS_PROMETHEUS_FILE), "w") as f:
+            f.write(self.to_prometheus())
+
+    def report(self) -> str:
+        """One line summary of the stages, for the run logs"""
+        with self.lock:
+            if not self.stage_seconds:
+                return "Stages: none"
+            return "Stages: " + ", ".join(
+                f"{name} {self.stage_seconds[name]:.1f}s ({self.stage_calls[name]})" for name in sorted(self.stage_seconds)
+            )
+
+
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$")
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """Endpoint of a request with the ids replaced, e.g. 'PUT api.i14y.admin.ch/api/partner/v1/datasets/{id}'"""
+    parsed = urlparse(url)
+    path = "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in parsed.path.split("/"))
+    return f"{method.upper()} {parsed.hostname}{path}"
+
+
+def label(value: str) -> str:
+    """Quoted Prometheus label value"""
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
+METRICS = RunMetrics()
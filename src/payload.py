@@ -0,0 +1,97 @@
+from typing import Any, Dict
+
+from utils import remove_empty_fields
+
+
+class Payload:
+    """
+    Base of the i14y payload objects. The slots are the JSON keys, in the order of the JSON document,
+    so that a payload is serialized with a single pass over its fields.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **fields: Any):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"Unknown fields for {type(self).__name__}: {', '.join(fields)}")
+
+    def to_dict(self) -> Dict:
+        """Serializes to the i14y JSON shape, dropping empty values like utils.remove_empty_fields"""
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value in (None, [], {}, ""):
+                continue
+            if isinstance(value, Payload):
+                value = value.to_dict()
+            elif isinstance(value, list):
+                value = [item.to_dict() if isinstance(item, Payload) else remove_empty_fields(item) for item in value]
+                value = [item for item in value if item not in (None, [], {})]
+            else:
+                value = remove_empty_fields(value)
+            if value not in (None, [], {}):
+                data[name] = value
+        return data
+
+
+class DistributionPayload(Payload):
+    """Distribution of a dataset as sent to i14y"""
+
+    __slots__ = (
+        "title",
+        "description",
+        "format",
+        "downloadUrl",
+        "mediaType",
+        "accessUrl",
+        "license",
+        "availability",
+        "issued",
+        "modified",
+        "rights",
+        "accessServices",
+        "byteSize",
+        "checksum",
+        "conformsTo",
+        "coverage",
+        "documentation",
+        "identifier",
+        "images",
+        "languages",
+        "packagingFormat",
+        "spatialResolution",
+        "temporalResolution",
+    )
+
+
+class DatasetPayload(Payload):
+    """Dataset as sent to i14y"""
+
+    __slots__ = (
+        "identifiers",
+        "title",
+        "description",
+        "accessRights",
+        "issued",
+        "modified",
+        "publisher",
+        "landingPages",
+        "keywords",
+        "distributions",
+        "languages",
+        "contactPoints",
+        "documentation",
+        "images",
+        "temporalCoverage",
+        "frequency",
+        "isReferencedBy",
+        "relations",
+        "spatial",
+        "version",
+        "versionNotes",
+        "conformsTo",
+        "themes",
+        "qualifiedRelations",
+    )
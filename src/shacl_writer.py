@@ -0,0 +1,93 @@
+import hashlib
+import io
+from typing import Dict, Optional
+
+# SHACL structures (Turtle) written directly from the metadata built by StructureImporter.get_bl_metadata,
+# without building an rdflib graph. Same shapes as the rdflib version kept in benchmark_shacl.py.
+
+I14Y_STRUCTURE_NS = "https://www.i14y.admin.ch/resources/datasets/structure/"
+
+PREFIXES = (
+    "@prefix dcterms: <http://purl.org/dc/terms/> .\n"
+    "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .\n"
+    "@prefix sh: <http://www.w3.org/ns/shacl#> .\n"
+    "@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\n"
+)
+
+SHACL_DATATYPES = {
+    "string": "xsd:string",
+    "integer": "xsd:integer",
+    "decimal": "xsd:decimal",
+    "gYear": "xsd:gYear",
+    "date": "xsd:date",
+    "boolean": "xsd:boolean",
+    "dateTime": "xsd:dateTime",
+    "anyURI": "xsd:anyURI",
+}
+
+_STRING_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"})
+
+# Characters not allowed in a Turtle IRIREF are percent-encoded
+_IRI_ESCAPES = str.maketrans(
+    {character: f"%{ord(character):02X}" for character in '<>"{}|^`\\' + "".join(map(chr, range(0x21)))}
+)
+
+
+def turtle_string(value: str, lang: Optional[str] = None) -> str:
+    literal = f'"{value.translate(_STRING_ESCAPES)}"'
+    return f"{literal}@{lang}" if lang else literal
+
+
+def turtle_iri(value: str) -> str:
+    return f"<{value.translate(_IRI_ESCAPES)}>"
+
+
+def write_shacl_turtle(metadata: Dict, timestamp: Optional[str] = None) -> str:
+    """
+    Writes the SHACL NodeShape of a dataset and a PropertyShape per field as Turtle.
+    timestamp (xsd:dateTime) is used for dcterms:created and dcterms:modified, they are left out if it is None.
+    """
+    out = io.StringIO()
+    write = out.write
+    shape_name = f"{metadata['identifier']}Shape"
+    shape = turtle_iri(f"{I14Y_STRUCTURE_NS}{shape_name}")
+    properties = [turtle_iri(f"{I14Y_STRUCTURE_NS}{shape_name}/{prop['name']}") for prop in metadata["properties"]]
+
+    write(PREFIXES)
+    write(f"\n{shape} a sh:NodeShape")
+    for lang, title in metadata["title"].items():
+        write(f" ;\n    rdfs:label {turtle_string(title, lang)}")
+    for lang, description in metadata["description"].items():
+        write(f" ;\n    dcterms:description {turtle_string(description, lang)}")
+    if timestamp is not None:
+        write(f' ;\n    dcterms:created "{timestamp}"^^xsd:dateTime')
+        write(f' ;\n    dcterms:modified "{timestamp}"^^xsd:dateTime')
+    write(" ;\n    sh:closed true")
+    if properties:
+        write(" ;\n    sh:property " + ",\n        ".join(properties))
+    write(" .\n")
+
+    for order, (prop_uri, prop) in enumerate(zip(properties, metadata["properties"])):
+        write(f"\n{prop_uri} a sh:PropertyShape")
+        write(f" ;\n    sh:path {prop_uri}")
+        write(f" ;\n    sh:order {order}")
+        write(" ;\n    sh:minCount 1 ;\n    sh:maxCount 1")
+        write(f" ;\n    sh:datatype {SHACL_DATATYPES.get(prop['datatype'], 'xsd:string')}")
+        for lang, label in prop["labels"].items():
+            write(f" ;\n    sh:name {turtle_string(label, lang)}")
+        if prop.get("pattern"):
+            write(f" ;\n    sh:pattern {turtle_string(prop['pattern'])}")
+        if prop.get("conformsTo"):
+            write(f" ;\n    dcterms:conformsTo {turtle_iri(prop['conformsTo'])}")
+        if prop.get("description"):
+            for lang, description in prop["description"].items():
+                if description:
+                    write(f" ;\n    sh:description {turtle_string(description, lang)}")
+        write(" .\n")
+
+    return out.getvalue()
+
+
+def shacl_fingerprint(metadata: Dict) -> str:
+    """Hash of the SHACL structure of a dataset, without its created/modified timestamps"""
+    return hashlib.sha256(write_shacl_turtle(metadata).encode("utf-8")).hexdigest()
@@ -1,13 +1,38 @@
+import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import os
+import queue
 import re
-from typing import Dict
+import threading
+from typing import Dict, List, Optional
 
-from rdflib import DCTERMS, RDF, RDFS, SH, XSD, Graph, Literal, Namespace, URIRef
+import requests
 import urllib3
-from common import CommonI14YAPI, reauth_if_token_expired
-from config import DESCRIPTION_CONFORMSTO_PREFIX, I14Y_USER_AGENT, MAX_WORKERS, ORGANIZATION_ID
+from common import (
+    RETRY_POLICY,
+    CatalogSnapshot,
+    CommonI14YAPI,
+    fetch_pages,
+    reauth_if_token_expired,
+    retry_key,
+    write_concurrency_report,
+)
+from config import (
+    BL_BASE_URL,
+    DESCRIPTION_CONFORMSTO_PREFIX,
+    FORCE_STRUCTURE_UPLOAD,
+    I14Y_USER_AGENT,
+    MAX_WORKERS,
+    ODS_BULK_METADATA_MIN_DATASETS,
+    ODS_PAGE_SIZE,
+    ODS_READ_WORKERS,
+    ORGANIZATION_ID,
+    STRUCTURE_QUEUE_SIZE,
+)
+from journal import RunJournal
+from metrics import METRICS
+from shacl_writer import shacl_fingerprint, write_shacl_turtle
 from utils import remove_html_tags
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -17,9 +42,13 @@ class StructureImporter(CommonI14YAPI):
     """Main structure importer that works with any format"""
 
     @staticmethod
-    def execute(api_params: Dict, import_all: bool = False):
+    def execute(
+        api_params: Dict, import_all: bool = False, snapshot: Optional[CatalogSnapshot] = None, resume: bool = False
+    ):
         """Main execution"""
         # If import_all=True we import structures for all the datasets and not only those updated and created by the harvester (useful for first run)
+        # If a snapshot is given (harvester run in the same process), the i14y catalog is not listed again
+        # If resume=True the structures uploaded by the previous run (journal) are not uploaded again
 
         importer = StructureImporter(api_params)
         datasets_to_process = {}
@@ -27,7 +56,7 @@ class StructureImporter(CommonI14YAPI):
         if not import_all:
             datasets_to_process = importer.create_datasets_to_process()
 
-        importer.run_import(datasets_to_process, import_all=import_all)
+        importer.run_import(datasets_to_process, import_all=import_all, snapshot=snapshot, resume=resume)
 
     def __init__(self, api_params: Dict[str, str]):
         """
@@ -40,6 +69,15 @@ class StructureImporter(CommonI14YAPI):
         """
         super().__init__(api_params)
         self.identifier_dataset_map = {}
+        # i14y id -> fingerprint of the last structure uploaded
+        self.structure_fingerprints_file_path = os.path.join(self.state_dir, "structure_fingerprints.json")
+        self.structure_fingerprints = {}
+        # data.bl.ch dataset id -> metadata (metas and fields), loaded once for all the datasets to process
+        self.ods_metadata_index = {}
+        # Structures uploaded by the current run, replayed by --resume if it does not complete
+        self.journal = RunJournal(os.path.join(self.state_dir, "structure_journal.jsonl"))
+        # Pipeline mode (see start_pipeline)
+        self.pipeline_lock = threading.Lock()
 
     def create_datasets_to_process(self) -> Dict[str, str]:
         """
@@ -55,91 +93,18 @@ class StructureImporter(CommonI14YAPI):
         actions = ["created", "updated"]
 
         for action in actions:
-            for identifier, i14y_id in dataset_status_identifier_id_map[action].items():
+            for identifier, i14y_id in dataset_status_identifier_id_map.get(action, {}).items():
                 datasets_to_process[identifier] = i14y_id
 
         return datasets_to_process
 
+    @METRICS.timed("structure_build")
     def create_shacl_graph(self, metadata: Dict) -> str:
-        """Create SHACL graph from metadata (format-agnostic)"""
-        g = Graph()
-
-        # Namespaces
-        SH_NS = SH
-        DCTERMS_NS = DCTERMS
-        RDFS_NS = RDFS
-        XSD_NS = XSD
-        I14Y_NS = Namespace("https://www.i14y.admin.ch/resources/datasets/structure/")
-
-        g.bind("sh", SH_NS)
-        g.bind("dcterms", DCTERMS_NS)
-        g.bind("rdfs", RDFS_NS)
-        g.bind("xsd", XSD_NS)
-        g.bind("i14y", I14Y_NS)
-
-        # Create main shape
-        shape_name = f"{metadata['identifier']}Shape"
-        shape_uri = I14Y_NS[shape_name]
-
-        g.add((shape_uri, RDF.type, SH_NS.NodeShape))
-
-        # Add titles
-        for lang, title in metadata["title"].items():
-            g.add((shape_uri, RDFS_NS.label, Literal(title, lang=lang)))
-
-        # Add descriptions
-        for lang, desc in metadata["description"].items():
-            g.add((shape_uri, DCTERMS_NS.description, Literal(desc, lang=lang)))
-
-        # Add timestamps
+        """Create SHACL structure (Turtle) from metadata"""
         now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-        g.add((shape_uri, DCTERMS_NS.created, Literal(now, datatype=XSD_NS.dateTime)))
-        g.add((shape_uri, DCTERMS_NS.modified, Literal(now, datatype=XSD_NS.dateTime)))
-
-        g.add((shape_uri, SH_NS.closed, Literal(True)))
-
-        # Add properties
-        for i, prop in enumerate(metadata["properties"]):
-            prop_uri = I14Y_NS[f"{shape_name}/{prop['name']}"]
-
-            g.add((prop_uri, RDF.type, SH_NS.PropertyShape))
-            g.add((shape_uri, SH_NS.property, prop_uri))
-            g.add((prop_uri, SH_NS.path, prop_uri))
-            g.add((prop_uri, SH_NS.order, Literal(i)))
-            g.add((prop_uri, SH_NS.minCount, Literal(1)))
-            g.add((prop_uri, SH_NS.maxCount, Literal(1)))
-
-            # Set datatype
-            datatype_map = {
-                "string": XSD_NS.string,
-                "integer": XSD_NS.integer,
-                "decimal": XSD_NS.decimal,
-                "gYear": XSD_NS.gYear,
-                "date": XSD_NS.date,
-                "boolean": XSD_NS.boolean,
-                "dateTime": XSD_NS.dateTime,
-                "anyURI": XSD_NS.anyURI,
-            }
-            datatype = datatype_map.get(prop["datatype"], XSD_NS.string)
-            g.add((prop_uri, SH_NS.datatype, datatype))
-
-            # Add multilingual names
-            for lang, label in prop["labels"].items():
-                g.add((prop_uri, SH_NS.name, Literal(label, lang=lang)))
-
-            if prop.get("pattern"):
-                g.add((prop_uri, SH_NS.pattern, Literal(prop["pattern"])))
-
-            if prop.get("conformsTo"):
-                g.add((prop_uri, DCTERMS_NS.conformsTo, URIRef(prop["conformsTo"])))
-
-            if prop.get("description"):
-                for lang, desc in prop["description"].items():
-                    if desc:
-                        g.add((prop_uri, SH_NS.description, Literal(desc, lang=lang)))
-
-        return g.serialize(format="turtle")
+        return write_shacl_turtle(metadata, timestamp=now)
 
+    @METRICS.timed("upload")
     @reauth_if_token_expired
     def upload_structure(self, dataset_id: str, turtle_data: str) -> bool:
         """Upload SHACL structure to API"""
@@ -155,13 +120,28 @@ class StructureImporter(CommonI14YAPI):
         files = {"file": ("structure.ttl", turtle_data, "text/turtle")}
 
         print(f"Uploading structure to {url}...")
-        response = self.session.post(url, headers=headers, files=files, verify=False, timeout=30)
+        # An import is not idempotent: clear whatever a failed attempt may have imported before retrying
+        response = RETRY_POLICY.run(
+            lambda: self.session.post(url, headers=headers, files=files, verify=False, timeout=30),
+            retry_key("POST", url),
+            before_retry=lambda: self.clear_partial_structure(dataset_id),
+        )
         response.raise_for_status()
 
         if response.status_code in {200, 201, 204}:
             print(f"\tStructure uploaded: {response.text.strip()}")
             return True
 
+    def clear_partial_structure(self, dataset_id: str) -> None:
+        """Deletes the structure a failed import may have left behind, so that the import can be retried"""
+        url = f"{self.api_base_url}/datasets/{dataset_id}/structures"
+        headers = {"Authorization": self.api_token, "User-Agent": I14Y_USER_AGENT}
+        response = self.session.delete(url, headers=headers, verify=False, timeout=30)
+        if response.status_code not in {200, 204, 404}:
+            print(f"Could not clear structure of dataset {dataset_id}: {response.status_code} - {response.text}")
+        return None
+
+    @METRICS.timed("structure_delete")
     @reauth_if_token_expired
     def delete_structure(self, dataset_id: str) -> bool:
         """Delete existing structure"""
@@ -187,22 +167,16 @@ class StructureImporter(CommonI14YAPI):
 
     def build_identifier_dataset_map(self) -> Dict:
         """Builds a id->dataset map with fetched datasets for current organization"""
-        identifier_dataset_map = {}
-        all_existing_datasets = self.get_all_existing_datasets(self.organization)
-        for dataset in all_existing_datasets:
-            identifier = dataset["identifiers"][0]
-            if self.identifier_pattern.match(identifier):
-                identifier_dataset_map[identifier] = dataset
-        return identifier_dataset_map
+        return CatalogSnapshot(self.get_all_existing_datasets(self.organization)).identifier_dataset_map()
 
     def _process_one_structure_job(self, identifier: str, dataset_id: str) -> Dict[str, str]:
         """
         Worker job: process one dataset structure import and return a standardized result.
         """
         try:
-            ok = self.process_dataset(dataset_id, identifier)
+            status = self.process_dataset(dataset_id, identifier)
             return {
-                "status": "created" if ok else "skipped",
+                "status": status,
                 "identifier": identifier,
                 "dataset_id": dataset_id,
             }
@@ -214,16 +188,53 @@ class StructureImporter(CommonI14YAPI):
                 "error": str(e),
             }
 
-    def get_bl_metadata(self, identifier, base_url: str = "https://data.bl.ch"):
-        match = self.identifier_pattern.match(identifier)
-        if match:
-            dataset_id = match.group(1)
-            url = f"{base_url}/api/explore/v2.1/catalog/datasets/{dataset_id}"
+    @METRICS.timed("metadata_index")
+    def build_ods_metadata_index(self, base_url: str = BL_BASE_URL) -> Dict[str, Dict]:
+        """Pages once through the data.bl.ch catalog and builds a dataset id -> metadata (metas and fields) map"""
+        url = f"{base_url}/api/explore/v2.1/catalog/datasets"
 
-            response = self.session.get(url, timeout=30)
+        def fetch_page(offset):
+            params = {"limit": ODS_PAGE_SIZE, "offset": offset}
+            response = self.session.get(url, params=params, timeout=60)
             response.raise_for_status()
+            return response.json()
+
+        first_page = fetch_page(0)
+        total = first_page.get("total_count", 0)
+        pages = [first_page] + fetch_pages(fetch_page, range(ODS_PAGE_SIZE, total, ODS_PAGE_SIZE), ODS_READ_WORKERS)
 
-            raw_metadata = response.json()
+        metadata_index = {}
+        for page in pages:
+            for ods_dataset in page.get("results", []):
+                metadata_index[ods_dataset["dataset_id"]] = ods_dataset
+
+        print(f"Fetched metadata of {len(metadata_index)} datasets from {base_url}")
+        return metadata_index
+
+    def load_ods_metadata_index(self):
+        """Builds the metadata index, datasets missing from it are fetched one by one"""
+        try:
+            self.ods_metadata_index = self.build_ods_metadata_index()
+        except requests.exceptions.RequestException as e:
+            print(f"Could not build metadata index, falling back to one request per dataset: {e}")
+            self.ods_metadata_index = {}
+
+    def get_ods_metadata(self, dataset_id: str, base_url: str = BL_BASE_URL) -> Dict:
+        """Returns the data.bl.ch metadata of a dataset from the metadata index"""
+        if dataset_id in self.ods_metadata_index:
+            return self.ods_metadata_index[dataset_id]
+
+        url = f"{base_url}/api/explore/v2.1/catalog/datasets/{dataset_id}"
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    @METRICS.timed("structure_metadata")
+    def get_bl_metadata(self, identifier, base_url: str = BL_BASE_URL):
+        match = self.identifier_pattern.match(identifier)
+        if match:
+            dataset_id = match.group(1)
+            raw_metadata = self.get_ods_metadata(dataset_id, base_url)
 
             metas_default = raw_metadata.get("metas", {}).get("default", {})
             lang = metas_default.get("language", "de")
@@ -284,35 +295,57 @@ class StructureImporter(CommonI14YAPI):
         else:
             return {}
 
-    def process_dataset(self, dataset_id: str, identifier: str) -> bool:
-        """Process a single dataset and create structure"""
+    def process_dataset(self, dataset_id: str, identifier: str) -> str:
+        """
+        Process a single dataset and create structure.
+        Returns "created", "unchanged" (same structure as the last upload, nothing sent) or "skipped"
+        """
         print(f"Processing: {identifier}")
 
         # Get dataset from API
         dataset_data = self.identifier_dataset_map[identifier]
         if not dataset_data:
-            return False
-
-        print(f"\tDeleting existing structure (dataset was updated)")
-        self.delete_structure(dataset_id)
+            return "skipped"
 
         metadata = self.get_bl_metadata(identifier)
 
         if not metadata:
             print(f"No metadata for {identifier}")
-            return False
+            print(f"\tDeleting existing structure (dataset was updated)")
+            self.delete_structure(dataset_id)
+            self.structure_fingerprints.pop(dataset_id, None)
+            return "skipped"
+
+        fingerprint = shacl_fingerprint(metadata)
+        if not FORCE_STRUCTURE_UPLOAD and self.structure_fingerprints.get(dataset_id) == fingerprint:
+            print(f"\tStructure unchanged since last upload, skipping")
+            return "unchanged"
+        if self.journal.done("structure", dataset_id, fingerprint=fingerprint):
+            print(f"\tStructure already uploaded before the run was interrupted, skipping")
+            return "unchanged"
 
-        # Create and upload SHACL
-        turtle_data = self.create_shacl_graph(metadata)
-        success = self.upload_structure(dataset_id, turtle_data)
+        print(f"\tDeleting existing structure (dataset was updated)")
+        self.delete_structure(dataset_id)
+        self.structure_fingerprints.pop(dataset_id, None)
+
+        # Upload SHACL
+        success = self.upload_structure(dataset_id, self.create_shacl_graph(metadata))
 
         if success:
+            self.structure_fingerprints[dataset_id] = fingerprint
+            self.journal.record("structure", dataset_id, identifier=identifier, fingerprint=fingerprint)
             print(f"\tStructure created successfully")
-            return True
+            return "created"
         else:
-            return False
-
-    def run_import(self, datasets_to_process: Dict[str, str], import_all: bool = False):
+            return "skipped"
+
+    def run_import(
+        self,
+        datasets_to_process: Dict[str, str],
+        import_all: bool = False,
+        snapshot: Optional[CatalogSnapshot] = None,
+        resume: bool = False,
+    ):
         """
         Main import process with harvest log awareness.
 
@@ -320,14 +353,15 @@ class StructureImporter(CommonI14YAPI):
             datasets_to_process Dict[str,str]: identifier -> i14y id map for datasets to process (those created or updated by harvester)
             import_all (bool):  if True we import structures for all the datasets and not only those updated and created by the harvester (useful for first run)
                                 if False we import structures only for datasets updated or created by the harvester
+            snapshot (CatalogSnapshot): i14y catalog already listed by the harvester, listed again if None
+            resume (bool): if True the structures journaled by the previous run are considered uploaded
         """
-        # Statistics
-        created_structure_datasets = []
-        skipped_structure_datasets = []
-        error_structure_datasets = []
-
         print("Starting extensible structure import...")
-        self.identifier_dataset_map = self.build_identifier_dataset_map()
+        if snapshot is not None:
+            self.identifier_dataset_map = snapshot.identifier_dataset_map()
+        else:
+            self.identifier_dataset_map = self.build_identifier_dataset_map()
+        self.load_structure_fingerprints(resume)
 
         dataset_to_process_identifier_data_map = {}
 
@@ -347,36 +381,146 @@ class StructureImporter(CommonI14YAPI):
                 continue
             jobs.append((identifier, dataset_id))
 
+        # For more than a few datasets, reading the whole catalog is cheaper than one request per dataset
+        if len(jobs) >= ODS_BULK_METADATA_MIN_DATASETS:
+            self.load_ods_metadata_index()
+
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             futures = [
                 executor.submit(self._process_one_structure_job, identifier, dataset_id)
                 for identifier, dataset_id in jobs
             ]
+            results = [future.result() for future in as_completed(futures)]
 
-            for future in as_completed(futures):
-                r = future.result()
-                status = r["status"]
-                identifier = r["identifier"]
-                dataset_id = r["dataset_id"]
-
-                if status == "created":
-                    created_structure_datasets.append(f"{identifier} : {dataset_id}")
-                elif status == "skipped":
-                    skipped_structure_datasets.append(f"{identifier} : {dataset_id}")
-                else:
-                    error_structure_datasets.append(
-                        f"{identifier} : {dataset_id} -> {r.get('error', 'unknown error')}"
-                    )
+        self.report_results(results)
+
+    def load_structure_fingerprints(self, resume: bool = False):
+        """Loads the fingerprints of the structures uploaded, including those journaled by the previous run on resume"""
+        self.structure_fingerprints = self.load_data(self.structure_fingerprints_file_path)
+        self.journal.open(resume)
+        for dataset_id, entry in self.journal.completed("structure").items():
+            self.structure_fingerprints[dataset_id] = entry["fingerprint"]
+
+    def start_pipeline(self, workers: int = MAX_WORKERS, resume: bool = False):
+        """
+        Pipeline mode: structures are imported while the harvest is still running. The harvester hands every
+        dataset it creates or updates to submit_structure; builder threads fetch the data.bl.ch metadata and
+        write the SHACL meanwhile, only the structure writes go through the i14y write limits.
+        """
+        print("Starting pipelined structure import...")
+        self.load_structure_fingerprints(resume)
+        self.pipeline_queue = queue.Queue(maxsize=STRUCTURE_QUEUE_SIZE)
+        self.pipeline_results = []
+        self.pipeline_submitted = 0
+        self.pipeline_index_loader = None
+        self.pipeline_threads = [
+            threading.Thread(target=self._run_pipeline_worker, name=f"structure-builder-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.pipeline_threads:
+            thread.start()
+
+    def submit_structure(self, identifier: str, dataset_id: str):
+        """Queues the structure import of a dataset created or updated by the harvester (blocks while the queue is full)"""
+        self.identifier_dataset_map[identifier] = {"id": dataset_id, "identifiers": [identifier]}
+        self.pipeline_submitted += 1
+        # Same threshold as run_import: from then on, reading the whole catalog is cheaper
+        if self.pipeline_submitted == ODS_BULK_METADATA_MIN_DATASETS:
+            self.pipeline_index_loader = threading.Thread(target=self.load_ods_metadata_index, daemon=True)
+            self.pipeline_index_loader.start()
+        self.pipeline_queue.put((identifier, dataset_id))
+
+    def _run_pipeline_worker(self):
+        while True:
+            job = self.pipeline_queue.get()
+            if job is None:
+                return
+            result = self._process_one_structure_job(*job)
+            with self.pipeline_lock:
+                self.pipeline_results.append(result)
+
+    def finish_pipeline(self, snapshot: Optional[CatalogSnapshot] = None):
+        """Waits for the queued structures, then writes the summary like run_import"""
+        for _ in self.pipeline_threads:
+            self.pipeline_queue.put(None)
+        for thread in self.pipeline_threads:
+            thread.join()
+        if self.pipeline_index_loader is not None:
+            self.pipeline_index_loader.join()
+
+        print(f"Datasets processed: {len(self.pipeline_results)}")
+        # The fingerprints of datasets no longer on i14y are only pruned if the harvester listed the catalog
+        if snapshot is not None:
+            self.identifier_dataset_map = snapshot.identifier_dataset_map()
+        self.report_results(self.pipeline_results, prune_fingerprints=snapshot is not None)
+
+    def cancel_pipeline(self):
+        """
+        Stops the pipeline after a failed harvest: the structures still queued are dropped, the ones being imported
+        are finished. Nothing is reported, the journal lets --resume import the structures of the run
+        """
+        dropped = 0
+        while True:
+            try:
+                job = self.pipeline_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                dropped += 1
+        for _ in self.pipeline_threads:
+            self.pipeline_queue.put(None)
+        for thread in self.pipeline_threads:
+            thread.join()
+        print(f"Structure import cancelled, {dropped} queued datasets dropped")
+
+    def report_results(self, results: List[Dict[str, str]], prune_fingerprints: bool = True):
+        """Saves the structure fingerprints, prints the summary and writes structure_import_log.txt"""
+        # Statistics
+        created_structure_datasets = []
+        unchanged_structure_datasets = []
+        skipped_structure_datasets = []
+        error_structure_datasets = []
+
+        for r in results:
+            status = r["status"]
+            identifier = r["identifier"]
+            dataset_id = r["dataset_id"]
+
+            if status == "created":
+                created_structure_datasets.append(f"{identifier} : {dataset_id}")
+            elif status == "unchanged":
+                unchanged_structure_datasets.append(f"{identifier} : {dataset_id}")
+            elif status == "skipped":
+                skipped_structure_datasets.append(f"{identifier} : {dataset_id}")
+            else:
+                error_structure_datasets.append(f"{identifier} : {dataset_id} -> {r.get('error', 'unknown error')}")
+
+        if prune_fingerprints:
+            # Forget the datasets that no longer exist on i14y
+            existing_ids = {data.get("id") for data in self.identifier_dataset_map.values()}
+            self.structure_fingerprints = {
+                dataset_id: fingerprint
+                for dataset_id, fingerprint in self.structure_fingerprints.items()
+                if dataset_id in existing_ids
+            }
+        self.save_data(self.structure_fingerprints, self.structure_fingerprints_file_path)
+        # The uploads are in the fingerprints now
+        self.journal.clear()
 
         created_structures = len(created_structure_datasets)
+        unchanged_structures = len(unchanged_structure_datasets)
         skipped = len(skipped_structure_datasets)
         errors = len(error_structure_datasets)
 
         # Print summary
         print(f"\n=== Summary ===")
         print(f"Structures created: {created_structures}")
+        print(f"Structures unchanged: {unchanged_structures}")
         print(f"Skipped: {skipped}")
         print(f"Errors: {errors}")
+        print(write_concurrency_report())
+        print(RETRY_POLICY.report())
+        print(METRICS.report())
 
         # Save log
         log_content = f"Structure import completed at {datetime.now()}"
@@ -384,18 +528,27 @@ class StructureImporter(CommonI14YAPI):
         log_content += f"\nStructures created: {created_structures}"
         for x in created_structure_datasets:
             log_content += f"\n- {x}"
+        log_content += f"\nStructures unchanged: {unchanged_structures}"
+        for x in unchanged_structure_datasets:
+            log_content += f"\n- {x}"
         log_content += f"\nSkipped: {skipped}"
         for x in skipped_structure_datasets:
             log_content += f"\n- {x}"
         log_content += f"\nErrors: {errors}"
         for x in error_structure_datasets:
             log_content += f"\n- {x}"
+        log_content += f"\n\n{write_concurrency_report()}"
+        log_content += f"\n{RETRY_POLICY.report()}"
+        log_content += f"\n{METRICS.report()}"
 
         with open("structure_import_log.txt", "w") as f:
             f.write(log_content)
 
         print("Log saved to structure_import_log.txt")
 
+        # Includes the harvest when it ran in the same process
+        METRICS.write()
+
         if errors > 0:
             raise Exception("There were errors in structure import script")
 
@@ -410,6 +563,12 @@ if __name__ == "__main__":
         "identifier_pattern": re.compile(r"^CH_KT_BL_dataset_(\d+)$"),
     }
 
+    arg_parser = argparse.ArgumentParser(description="Imports the structures of the data.bl.ch datasets to i14y")
+    arg_parser.add_argument(
+        "--resume", action="store_true", help="skip the structures uploaded by the previous run, if it failed"
+    )
+    args = arg_parser.parse_args()
+
     import_all = os.environ.get("IMPORT_ALL", "false") == "true"
 
-    StructureImporter.execute(api_params, import_all=import_all)
+    StructureImporter.execute(api_params, import_all=import_all, resume=args.resume)
@@ -1,10 +1,99 @@
 from datetime import datetime 
+from functools import lru_cache
+import hashlib
+from html.parser import HTMLParser
+import json
+import re
 from bs4 import BeautifulSoup
+from config import DATE_CACHE_SIZE, HTML_TEXT_CACHE_SIZE
+from dateutil import parser as dateutil_parser
+from dateutil.tz import UTC
 from urllib.parse import urlparse
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+# Character references decoded the same way as BeautifulSoup does (others are left to BeautifulSoup)
+_PLAIN_ENTITIES = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'", "nbsp": "\xa0"}
+# Elements whose content BeautifulSoup leaves out of the text or keeps with its whitespace
+_SPECIAL_ELEMENTS = {"script", "style", "template", "rt", "rp", "pre", "textarea", "title"}
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class _TextCollector(HTMLParser):
+    """
+    Collects the text of an HTML fragment like BeautifulSoup(html, "html.parser").get_text(), which is built on
+    the same tokenizer: strings between tags that only contain whitespace are reduced to a newline or a space.
+    Markup that BeautifulSoup handles differently (comments, declarations, special elements, unusual character
+    references) is only flagged.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts: List[str] = []
+        self.string: List[str] = []
+        self.special = False
+
+    def end_string(self):
+        if self.string:
+            string = "".join(self.string)
+            self.string = []
+            if not string.strip(_ASCII_SPACES):
+                string = "\n" if "\n" in string else " "
+            self.parts.append(string)
+
+    def handle_data(self, data: str):
+        self.string.append(data)
+
+    def handle_entityref(self, name: str):
+        if name in _PLAIN_ENTITIES:
+            self.string.append(_PLAIN_ENTITIES[name])
+        else:
+            self.special = True
+
+    def handle_charref(self, name: str):
+        try:
+            codepoint = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+        except ValueError:
+            codepoint = -1
+        if 0x20 <= codepoint < 0x7F or 0xA0 <= codepoint < 0xD800:
+            self.string.append(chr(codepoint))
+        else:
+            self.special = True
+
+    def handle_starttag(self, tag: str, attrs):
+        self.special = self.special or tag in _SPECIAL_ELEMENTS
+        self.end_string()
+
+    def handle_endtag(self, tag: str):
+        self.special = self.special or tag in _SPECIAL_ELEMENTS
+        self.end_string()
+
+    def handle_comment(self, data: str):
+        self.special = True
+
+    def handle_decl(self, decl: str):
+        self.special = True
+
+    def handle_pi(self, data: str):
+        self.special = True
+
+    def unknown_decl(self, data: str):
+        self.special = True
+
+    def text(self) -> str:
+        self.end_string()
+        return "".join(self.parts)
+
+
+@lru_cache(maxsize=HTML_TEXT_CACHE_SIZE)
 def remove_html_tags(text: str) -> str:
-    """Remove HTML tags using BeautifulSoup."""
+    """Remove HTML tags (same text as BeautifulSoup, which is only used for unusual markup)."""
+    if "<" not in text and "&" not in text and text.strip(_ASCII_SPACES):
+        return text
+    collector = _TextCollector()
+    collector.feed(text)
+    collector.close()
+    if not collector.special:
+        return collector.text()
     return BeautifulSoup(text, "html.parser").get_text()
 
 def normalize_uri(uri: str) -> str:
@@ -19,10 +108,14 @@ def is_valid_uri(uri: str) -> bool:
     except ValueError:
         return False
 
-def format_date(value_str: str) -> Optional[str]:
-    """Helper to format date strings consistently."""
-    if not value_str:
-        return None
+# Formats emitted by data.bl.ch, normalized without dateutil (years before 1000 are left to the generic code)
+_ISO_DATE = re.compile(r"([1-9]\d{3})-(\d{2})-(\d{2})")
+_ISO_DATETIME = re.compile(r"([1-9]\d{3})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:Z|[+-](?:[01]\d|2[0-3]):[0-5]\d)?")
+# value -> (normalized value, datetime), bounded by DATE_CACHE_SIZE
+_normalized_dates: Dict[str, Tuple[str, Optional[datetime]]] = {}
+
+
+def _normalize_date_generic(value_str: str) -> str:
     try:
         if len(value_str) == 10:
             return datetime.strptime(value_str, "%Y-%m-%d").strftime("%Y-%m-%dT00:00:00Z")
@@ -30,16 +123,82 @@ def format_date(value_str: str) -> Optional[str]:
     except ValueError:
         return value_str
 
+
+def normalize_date(value_str: str) -> Tuple[str, Optional[datetime]]:
+    """
+    Normalizes a date to YYYY-MM-DDTHH:MM:SSZ (a UTC offset is dropped, not applied) and returns it with its
+    datetime when the value is in one of the usual ISO 8601 formats. Values that are not dates are returned as is.
+    """
+    cached = _normalized_dates.get(value_str)
+    if cached is not None:
+        return cached
+
+    normalized = None
+    match = _ISO_DATETIME.fullmatch(value_str) or _ISO_DATE.fullmatch(value_str)
+    if match:
+        fields = match.groups()
+        try:
+            parsed = datetime(*map(int, fields), tzinfo=UTC)
+            normalized = (f"{fields[0]}-{fields[1]}-{fields[2]}T{':'.join(fields[3:]) or '00:00:00'}Z", parsed)
+        except ValueError:
+            pass
+    if normalized is None:
+        normalized = (_normalize_date_generic(value_str), None)
+
+    if len(_normalized_dates) >= DATE_CACHE_SIZE:
+        _normalized_dates.clear()
+    _normalized_dates[value_str] = normalized
+    if normalized[1] is not None:
+        # The normalized value is parsed again by parse_date (e.g. for the modified date check)
+        _normalized_dates[normalized[0]] = normalized
+    return normalized
+
+
+def format_date(value_str: str) -> Optional[str]:
+    """Helper to format date strings consistently."""
+    if not value_str:
+        return None
+    return normalize_date(value_str)[0]
+
+
+def parse_date(date_str: Optional[str]) -> Optional[datetime]:
+    """Safely parse a date string (normalized dates come from the cache, others from dateutil), None if invalid"""
+    if not date_str:
+        return None
+    if isinstance(date_str, str):
+        normalized, parsed = normalize_date(date_str)
+        if parsed is not None and normalized == date_str:
+            return parsed
+    try:
+        return dateutil_parser.parse(date_str)
+    except (ValueError, TypeError):
+        return None
+
+
 def remove_empty_fields(data: Union[Dict, List]) -> Union[Dict, List]:
     """
     Recursively remove empty lists, empty dicts, and None values from a dictionary.
+    Every value is visited once (empty strings are removed from dicts but kept in lists).
     """
     if isinstance(data, dict):
-        return {
-            k: remove_empty_fields(v)
-            for k, v in data.items()
-            if v not in (None, [], {}, "") and remove_empty_fields(v) not in (None, [], {})
-        }
+        pruned = {}
+        for k, v in data.items():
+            if v in (None, [], {}, ""):
+                continue
+            v = remove_empty_fields(v)
+            if v not in (None, [], {}):
+                pruned[k] = v
+        return pruned
     elif isinstance(data, list):
-        return [remove_empty_fields(v) for v in data if remove_empty_fields(v) not in (None, [], {})]
+        pruned = []
+        for v in data:
+            v = remove_empty_fields(v)
+            if v not in (None, [], {}):
+                pruned.append(v)
+        return pruned
     return data
+
+def payload_fingerprint(payload: Union[Dict, List]) -> str:
+    """Returns a canonical hash of a JSON payload (independent of key order and formatting)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()